@@ -0,0 +1,198 @@
+"""ASGI serving mode.
+
+The items endpoints run their upstream calls on the event loop with
+httpx, so one worker process keeps many slow WMS calls in flight without a
+thread per call. All other routes are served by the Flask app in a worker
+thread. Run it with:
+
+    uvicorn asgi:application --workers 2
+
+The WSGI app in ogcapi_f stays the entry point for Zappa.
+"""
+import asyncio
+
+import httpx
+
+import metrics
+import ogcapi_f
+import upstream
+from cache import AsyncSingleFlight
+from ogcapi_f import app
+
+ASYNC_ENDPOINTS = ["getcollitems", "getcollitembyid"]
+
+_semaphores = {}
+
+# Identical upstream calls in flight at the same time share one request
+upstream_flight = AsyncSingleFlight()
+
+
+def flight_metrics():
+    flight = upstream_flight.stats()
+    return [
+        ("ogcapi_upstream_calls_total", "counter", "Upstream calls made", {"mode": "asgi"}, flight["misses"]),
+        ("ogcapi_upstream_coalesced_total", "counter", "Upstream calls shared with an identical call in flight", {"mode": "asgi"}, flight["hits"]),
+        ("ogcapi_upstream_waiters", "gauge", "Callers waiting for an identical call in flight", {"mode": "asgi"}, flight["waiters"]),
+    ]
+
+metrics.register(flight_metrics)
+
+
+def semaphore(coll):
+    # Per collection cap on upstream calls in flight, like fanout.FanOut
+    if coll not in _semaphores:
+        limit = ogcapi_f.UPSTREAM_CONCURRENCY
+        if coll in ogcapi_f.coll_by_name:
+            limit = ogcapi_f.coll_by_name[coll].get("max_concurrency", limit)
+        _semaphores[coll] = asyncio.Semaphore(limit)
+    return _semaphores[coll]
+
+
+def collections_changed(added, removed, changed):
+    for coll in removed+changed:
+        _semaphores.pop(coll, None)
+
+ogcapi_f.registry.listen(collections_changed)
+
+
+async def arun_steps(steps, headers=None, timeout=ogcapi_f.TIMEOUT):
+    """ogcapi_f.run_steps() with non-blocking upstream calls."""
+    try:
+        url, decode = next(steps)
+        while True:
+            result = await upstream_flight.do(upstream.normalize_url(url), lambda: fetch_upstream(url, decode, headers, timeout))
+            url, decode = steps.send(result)
+    except StopIteration as e:
+        return e.value
+
+
+async def fetch_upstream(url, decode, headers=None, timeout=ogcapi_f.TIMEOUT):
+    with metrics.timed("upstream"):
+        response = await upstream.aget(url, headers=headers, timeout=timeout)
+    if decode is None:
+        return response
+    with metrics.timed("decode"):
+        return decode(response)
+
+
+async def getcollitems(coll):
+    # prepare_items() can load the capabilities on a cold cache
+    query = await asyncio.to_thread(ogcapi_f.prepare_items, coll)
+    if isinstance(query, ogcapi_f.Response):
+        return query
+
+    headers = {
+        'Content-Type': 'application/json'
+    }
+    service = query["coll_info"]["service"]
+
+    async def fetch(batch):
+        async with semaphore(coll):
+            steps = ogcapi_f.request_batch_steps(service, [query["jobs"][i] for i in batch], coll)
+            return await arun_steps(steps, headers, ogcapi_f.TIMEOUT)
+
+    try:
+        batch_results = await asyncio.wait_for(
+            asyncio.gather(*[fetch(batch) for batch in query["batches"]]), ogcapi_f.REQUEST_DEADLINE)
+    except (asyncio.TimeoutError, httpx.TimeoutException):
+        return ogcapi_f.Response("Upstream request deadline exceeded", 504)
+    return ogcapi_f.items_response(query, batch_results)
+
+
+async def getcollitembyid(coll, featureid):
+    ogcapi_f.log.debug("REQUESTING FEATURE %s of %s", featureid, coll)
+    query = await asyncio.to_thread(ogcapi_f.prepare_item, coll, featureid)
+    if isinstance(query, ogcapi_f.Response):
+        return query
+
+    headers = {
+        'Content-Type': 'application/geo+json',
+    }
+    result = ogcapi_f.stored_item(query)
+    if result is not None:
+        return ogcapi_f.item_response(query, result)
+    coll_info = query["coll_info"]
+    steps = ogcapi_f.request_by_id_steps(coll_info["service"], coll_info["name"], query["item"])
+    try:
+        async with semaphore(coll):
+            result = await asyncio.wait_for(arun_steps(steps, headers), ogcapi_f.REQUEST_DEADLINE)
+    except (asyncio.TimeoutError, httpx.TimeoutException):
+        return ogcapi_f.Response("Upstream request deadline exceeded", 504)
+    return ogcapi_f.item_response(query, result)
+
+
+async def dispatch():
+    """Response for the request in the current Flask request context."""
+    endpoint = None
+    if ogcapi_f.request.url_rule is not None:
+        endpoint = ogcapi_f.request.url_rule.endpoint
+    if endpoint not in ASYNC_ENDPOINTS:
+        return await asyncio.to_thread(app.full_dispatch_request)
+
+    try:
+        rv = app.preprocess_request()
+        if rv is None:
+            rv = await globals()[endpoint](**ogcapi_f.request.view_args)
+    except Exception as e:
+        rv = app.handle_user_exception(e)
+    return app.finalize_request(rv)
+
+
+def request_context(scope):
+    headers = [(k.decode("latin-1"), v.decode("latin-1")) for k, v in scope["headers"]]
+    host = dict((k.lower(), v) for k, v in headers).get("host")
+    if host is None:
+        host = "%s:%d"%tuple(scope["server"])
+    base_url = "%s://%s%s/"%(scope.get("scheme", "http"), host, scope.get("root_path", ""))
+    path = scope.get("raw_path")
+    if path is not None:
+        path = path.decode("latin-1")
+    else:
+        path = scope["path"]
+    return app.test_request_context(path, base_url=base_url, method=scope["method"],
+                                    query_string=scope["query_string"].decode("latin-1"), headers=headers)
+
+
+async def send_response(send, response):
+    await send({
+        "type": "http.response.start",
+        "status": response.status_code,
+        "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in response.headers.items()],
+    })
+    # A streamed items response is consumed here, all its upstream results
+    # are already in
+    for chunk in response.response:
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8")
+        if chunk:
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+    await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await upstream.aclose()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    with request_context(scope):
+        try:
+            response = await dispatch()
+        except Exception as e:
+            response = app.handle_exception(e)
+        try:
+            await send_response(send, response)
+        finally:
+            response.close()
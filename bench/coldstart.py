@@ -0,0 +1,102 @@
+"""Cold start benchmark: import time of ogcapi_f and its first requests.
+
+    python -m bench.coldstart --runs 10 --output coldstart.json
+
+Every run is a fresh interpreter, like a new Lambda container. It reports
+the median and worst import time, the time of the first /, /api and
+/collections requests, the GetCapabilities calls /collections made (none
+with a capabilities snapshot) and the modules with the largest cumulative
+import time (from python -X importtime) as JSON, so cold starts of two
+versions (or with and without the prebuild.py artifacts) can be compared.
+The collections are served by a local bench.stubwms.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+
+from bench.stubwms import StubWMS
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+RUN = """
+import json, sys, time
+t0 = time.perf_counter()
+import ogcapi_f
+t1 = time.perf_counter()
+for c in ogcapi_f.collections:
+    c["service"] = sys.argv[1]
+client = ogcapi_f.app.test_client()
+client.get("/")
+t2 = time.perf_counter()
+client.get("/api")
+t3 = time.perf_counter()
+client.get("/collections?f=json")
+t4 = time.perf_counter()
+print(json.dumps({"import_s": t1-t0, "root_s": t2-t1, "api_s": t3-t2, "collections_s": t4-t3}))
+"""
+
+
+def run_once(stub):
+    stub.reset()
+    out = subprocess.run([sys.executable, "-c", RUN, stub.url], cwd=ROOT, capture_output=True, text=True, check=True)
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    result["capabilities_calls"] = stub.calls.get("getcapabilities", 0)
+    return result
+
+
+def import_times(top):
+    """(module, cumulative seconds) of the slowest imports."""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import ogcapi_f"],
+                         cwd=ROOT, capture_output=True, text=True, check=True)
+    modules = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line.split(":", 1)[1].split("|")
+        modules.append((name.strip(), int(cumulative_us)/1e6))
+    modules.sort(key=lambda m: -m[1])
+    return modules[:top]
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values)//2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ogcapi_f cold start benchmark")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--top", type=int, default=15, help="number of slowest imports to report")
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    a = parser.parse_args()
+
+    stub = StubWMS().start()
+    try:
+        runs = [run_once(stub) for _ in range(a.runs)]
+    finally:
+        stub.stop()
+    report = {
+        "python": platform.python_version(),
+        "runs": a.runs,
+        "openapi_prebuilt": os.path.exists(os.environ.get("OPENAPI_FILE", os.path.join(ROOT, "openapi.json"))),
+        "capabilities_snapshot": os.path.exists(os.environ.get("CAPABILITIES_SNAPSHOT", os.path.join(ROOT, "capabilities.json"))),
+        "import_s": {"median": median([r["import_s"] for r in runs]), "max": max(r["import_s"] for r in runs)},
+        "first_root_s": median([r["root_s"] for r in runs]),
+        "first_api_s": median([r["api_s"] for r in runs]),
+        "first_collections_s": median([r["collections_s"] for r in runs]),
+        "first_collections_capabilities_calls": max(r["capabilities_calls"] for r in runs),
+        "slowest_imports": [{"module": m, "cumulative_s": s} for m, s in import_times(a.top)],
+    }
+    out = json.dumps(report, indent=2)
+    if a.output:
+        with open(a.output, "w") as f:
+            f.write(out+"\n")
+    else:
+        print(out)
+
+
+if __name__ == "__main__":
+    main()
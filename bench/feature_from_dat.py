@@ -0,0 +1,67 @@
+"""Micro-benchmark of feature_from_dat on a synthetic getPointValue entry.
+
+    python -m bench.feature_from_dat --timesteps 60 --elevations 10 --members 20
+
+Decodes the same entry a number of times and prints the best time as
+JSON.
+"""
+import argparse
+import json
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import ogcapi_f
+
+
+def make_dat(timesteps, elevations, members):
+    start = datetime(2021, 6, 20, 0, 0, 0)
+    times = [(start+timedelta(hours=i)).strftime("%Y-%m-%dT%H:%M:%SZ") for i in range(timesteps)]
+    reference_time = times[0]
+    data = OrderedDict()
+    for i, t in enumerate(times):
+        by_elevation = OrderedDict()
+        for e in range(elevations):
+            by_member = OrderedDict()
+            for m in range(members):
+                by_member[str(m)] = "%.6f"%(280+i*0.37+e*1.3-m*0.011)
+            by_elevation[str(e*100)] = by_member
+        data[t] = OrderedDict([(reference_time, by_elevation)])
+    return {
+        "point": {"SRS": "EPSG:4326", "coords": "5.200000,52.000000"},
+        "standard_name": "air_temperature",
+        "units": "K",
+        "name": "air_temperature__at_ml",
+        "long_name": "air_temperature",
+        "dims": ["time", "reference_time", "elevation", "member"],
+        "data": data,
+    }
+
+
+def timeit(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter()-start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="feature_from_dat micro-benchmark")
+    parser.add_argument("--timesteps", type=int, default=60)
+    parser.add_argument("--elevations", type=int, default=10)
+    parser.add_argument("--members", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    a = parser.parse_args()
+
+    dat = make_dat(a.timesteps, a.elevations, a.members)
+    decode = lambda: ogcapi_f.feature_from_dat(dat, "air_temperature__at_ml", "harmonie")
+
+    print(json.dumps({
+        "timesteps": a.timesteps,
+        "features": a.elevations*a.members,
+        "seconds": round(timeit(decode, a.repeat), 6),
+    }))
@@ -0,0 +1,67 @@
+"""Benchmark of the JSON decode/encode path on getPointValue payloads.
+
+    python -m bench.serialization [captured.json ...]
+
+Without arguments a payload is generated with the stub WMS. Compares the
+old stdlib decode with an OrderedDict hook and stdlib encode against the
+configured serialization backend, and prints the timings as JSON.
+"""
+import json
+import sys
+import time
+from collections import OrderedDict
+
+import ogcapi_f
+import serialization
+from bench.stubwms import StubWMS
+
+
+def best_of(fn, repeat=10):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter()-start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def payloads(paths):
+    if paths:
+        for path in paths:
+            with open(path, "rb") as f:
+                yield path, f.read()
+        return
+    stub = StubWMS(layers={"air_temperature__at_ml": {"member": [str(m) for m in range(20)]}}, timesteps=60)
+    data = stub.point_values({"X": "5.2", "Y": "52.0", "LAYERS": "air_temperature__at_ml", "DIM_MEMBER": "*"})
+    yield "stub 60 timesteps x 20 members", json.dumps(data).encode("utf-8")
+
+
+if __name__ == "__main__":
+    for name, content in payloads(sys.argv[1:]):
+        stdlib_loads = lambda: json.loads(content.decode("utf-8"), object_pairs_hook=OrderedDict)
+        backend_loads = lambda: serialization.loads(content)
+        features = []
+        for dat in backend_loads():
+            features.extend(ogcapi_f.feature_from_dat(dat, dat["name"], "bench"))
+        collection = {"type": "FeatureCollection", "features": features}
+        stdlib_dumps = lambda: json.dumps(collection)
+        backend_dumps = lambda: serialization.dumpb(collection)
+
+        decode_old = best_of(stdlib_loads)
+        decode_new = best_of(backend_loads)
+        encode_old = best_of(stdlib_dumps)
+        encode_new = best_of(backend_dumps)
+        print(json.dumps({
+            "payload": name,
+            "backend": serialization.BACKEND,
+            "bytes": len(content),
+            "features": len(features),
+            "decode_stdlib_ordereddict_s": round(decode_old, 6),
+            "decode_backend_s": round(decode_new, 6),
+            "decode_speedup": round(decode_old/decode_new, 2),
+            "encode_stdlib_s": round(encode_old, 6),
+            "encode_backend_s": round(encode_new, 6),
+            "encode_speedup": round(encode_old/encode_new, 2),
+        }))
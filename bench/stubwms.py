@@ -0,0 +1,208 @@
+"""Local stub of an ADAGUC WMS.
+
+Serves canned GetCapabilities and getPointValue responses so the upstream
+code paths can be exercised without geoservices.knmi.nl:
+
+    python -m bench.stubwms --port 8090 --latency 0.05
+
+and point a collection "service" at http://127.0.0.1:8090/wms?DATASET=STUB
+"""
+import argparse
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+CAPABILITIES = """<?xml version="1.0" encoding="UTF-8"?>
+<WMS_Capabilities version="1.3.0" xmlns="http://www.opengis.net/wms" xmlns:xlink="http://www.w3.org/1999/xlink">
+<Service><Name>WMS</Name><Title>Stub ADAGUC WMS</Title><OnlineResource xlink:href="%(url)s"/></Service>
+<Capability>
+<Request>
+<GetCapabilities><Format>text/xml</Format><DCPType><HTTP><Get><OnlineResource xlink:href="%(url)s"/></Get></HTTP></DCPType></GetCapabilities>
+<GetMap><Format>image/png</Format><DCPType><HTTP><Get><OnlineResource xlink:href="%(url)s"/></Get></HTTP></DCPType></GetMap>
+</Request>
+<Layer><Title>Stub</Title><CRS>EPSG:4326</CRS>
+%(layers)s
+</Layer>
+</Capability>
+</WMS_Capabilities>
+"""
+
+LAYER = """<Layer queryable="1"><Name>%(name)s</Name><Title>%(name)s</Title><CRS>EPSG:4326</CRS>
+<EX_GeographicBoundingBox><westBoundLongitude>0</westBoundLongitude><eastBoundLongitude>11</eastBoundLongitude><southBoundLatitude>48</southBoundLatitude><northBoundLatitude>56</northBoundLatitude></EX_GeographicBoundingBox>
+%(bbox)s<Dimension name="time" units="ISO8601" default="%(time_default)s">%(times)s</Dimension>
+<Dimension name="reference_time" units="ISO8601" default="%(reference_default)s">%(reference_times)s</Dimension>
+%(dims)s</Layer>"""
+
+DIMENSION = """<Dimension name="%(name)s" units="-" default="%(default)s">%(values)s</Dimension>"""
+
+
+class StubWMS:
+    """Stub ADAGUC WMS in a background thread.
+
+    layers maps a layer name to a dict of extra dimensions (name -> list of
+    values). Every layer has timesteps hourly time values and
+    reference_times model runs. latency is added to every getPointValue
+    call and fail_first makes the first n requests answer 503. With
+    resolution (degrees) the layers advertise a lon/lat grid.
+    """
+    def __init__(self, layers=None, timesteps=48, reference_times=4, latency=0.0,
+                 capabilities_latency=0.0, fail_first=0, port=0, resolution=None):
+        if layers is None:
+            layers = {
+                "air_temperature__at_2m": {},
+                "precipitation_flux": {},
+                "wind__at_10m": {},
+            }
+        self.layers = layers
+        start = datetime(2021, 6, 20, 0, 0, 0)
+        self.reference_times = [(start+timedelta(hours=3*i)).strftime("%Y-%m-%dT%H:%M:%SZ") for i in range(reference_times)]
+        self.timesteps = timesteps
+        self.latency = latency
+        self.capabilities_latency = capabilities_latency
+        self.fail_first = fail_first
+        self.port = port
+        self.resolution = resolution
+        self.calls = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:%d/wms?DATASET=STUB"%(self._server.server_address[1],)
+
+    def count(self, request_type):
+        with self._lock:
+            self.calls[request_type] = self.calls.get(request_type, 0)+1
+            total = sum(self.calls.values())
+        return total
+
+    def reset(self):
+        with self._lock:
+            self.calls = {}
+
+    def times(self, reference_time):
+        start = datetime.strptime(reference_time, "%Y-%m-%dT%H:%M:%SZ")
+        return [(start+timedelta(hours=i)).strftime("%Y-%m-%dT%H:%M:%SZ") for i in range(self.timesteps)]
+
+    def capabilities(self):
+        layers = []
+        times = self.times(self.reference_times[-1])
+        bbox = ""
+        if self.resolution:
+            bbox = '<BoundingBox CRS="CRS:84" minx="0" miny="48" maxx="11" maxy="56" resx="%(r)s" resy="%(r)s"/>'%{"r": self.resolution}
+        for name, dims in self.layers.items():
+            extra = "".join(DIMENSION%{"name": d, "default": v[0], "values": ",".join(v)} for d, v in dims.items())
+            layers.append(LAYER%{
+                "name": name,
+                "time_default": times[0],
+                "times": ",".join(times),
+                "reference_default": self.reference_times[-1],
+                "reference_times": ",".join(self.reference_times),
+                "dims": extra,
+                "bbox": bbox,
+            })
+        return CAPABILITIES%{"url": self.url.replace("&", "&amp;"), "layers": "\n".join(layers)}
+
+    def point_values(self, query):
+        x = float(query["X"])
+        y = float(query["Y"])
+        reference_time = query.get("DIM_REFERENCE_TIME", self.reference_times[-1])
+        times = self.times(reference_time)
+        if query.get("TIME", "*") not in ("*", ""):
+            start, _, end = query["TIME"].partition("/")
+            end = end or start
+            times = [t for t in times if start <= t <= end]
+        result = []
+        for layer in query["LAYERS"].split(","):
+            if layer not in self.layers:
+                return None
+            dims = ["time", "reference_time"]
+            selected = [[reference_time]]
+            for d, values in self.layers[layer].items():
+                value = query.get("DIM_"+d.upper(), query.get(d.upper(), values[0]))
+                dims.append(d)
+                selected.append(values if value == "*" else value.split(","))
+
+            def nest(level, seed):
+                if level == len(selected):
+                    return "%.2f"%(seed)
+                return {v: nest(level+1, seed+i*0.1) for i, v in enumerate(selected[level])}
+
+            data = {t: nest(0, x+y+i) for i, t in enumerate(times)}
+            result.append({
+                "point": {"SRS": "EPSG:4326", "coords": "%f,%f"%(x, y)},
+                "standard_name": layer,
+                "units": "K",
+                "name": layer,
+                "long_name": layer,
+                "dims": dims,
+                "data": data,
+            })
+        return result
+
+    def start(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def send(self, status, content_type, body):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                query = {k.upper(): v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+                request_type = query.get("REQUEST", "").lower()
+                if stub.count(request_type) <= stub.fail_first:
+                    self.send(503, "text/plain", b"Service unavailable")
+                elif request_type == "getcapabilities":
+                    time.sleep(stub.capabilities_latency)
+                    self.send(200, "text/xml", stub.capabilities().encode("utf-8"))
+                elif request_type == "getpointvalue":
+                    time.sleep(stub.latency)
+                    data = stub.point_values(query)
+                    if data is None:
+                        body = ('<?xml version="1.0"?><ServiceExceptionReport><ServiceException code="LayerNotDefined">'
+                                'Layer not found</ServiceException></ServiceExceptionReport>')
+                        self.send(200, "text/xml", body.encode("utf-8"))
+                    else:
+                        self.send(200, "application/json", json.dumps(data).encode("utf-8"))
+                else:
+                    self.send(400, "text/plain", b"Unsupported request")
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", self.port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub ADAGUC WMS")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--timesteps", type=int, default=48)
+    parser.add_argument("--fail-first", type=int, default=0)
+    parser.add_argument("--resolution", type=float, help="advertise a lon/lat grid of this resolution in degrees")
+    a = parser.parse_args()
+    stub = StubWMS(timesteps=a.timesteps, latency=a.latency, fail_first=a.fail_first, port=a.port, resolution=a.resolution).start()
+    print("Stub WMS at", stub.url)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stub.stop()
@@ -0,0 +1,178 @@
+"""Benchmark suite of the API endpoints against the stub WMS.
+
+    python -m bench.suite --latency 0.05 --timesteps 48 --members 10 --output before.json
+
+Starts a bench.stubwms.StubWMS, serves one collection from it and drives
+/collections, /collections/<coll>/items for several npoints, limit and
+parameter counts and /collections/<coll>/items/<id>, with the feature
+fetched upstream and from the item store, through the Flask test client
+with a number of concurrent clients. For every scenario it reports
+throughput, p50/p95/p99 latency, the number of upstream calls and the peak
+Python memory of one concurrent round as JSON, so runs of two versions can
+be compared.
+"""
+import argparse
+import json
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+import ogcapi_f
+import serialization
+from bench.stubwms import StubWMS
+
+COLLECTION = "bench"
+LAYERS = ["air_temperature__at_2m", "precipitation_flux", "wind__at_10m", "relative_humidity__at_2m"]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return None
+    k = min(int(round(p/100.0*(len(values)-1))), len(values)-1)
+    return values[k]
+
+
+def scenarios(item_id, npoints, limits, parameters):
+    yield "collections", "/collections"
+    yield "collection", "/collections/%s"%(COLLECTION,)
+    for n in npoints:
+        for limit in limits:
+            for p in parameters:
+                yield ("items npoints=%d limit=%d parameters=%d"%(n, limit, p),
+                       "/collections/%s/items?npoints=%d&limit=%d&observedPropertyName=%s"%(
+                           COLLECTION, n, limit, ",".join(LAYERS[:p])))
+    if item_id is not None:
+        path = "/collections/%s/items/%s"%(COLLECTION, quote(item_id, safe=""))
+        yield "item", path
+        yield "item stored", path
+
+
+def run(path, requests, concurrency):
+    client = ogcapi_f.app.test_client()
+
+    def one(_):
+        start = time.perf_counter()
+        response = client.get(path)
+        response.get_data()
+        elapsed = time.perf_counter()-start
+        if response.status_code != 200:
+            raise RuntimeError("%s answered %d"%(path, response.status_code))
+        return elapsed
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(one, range(requests)))
+    return time.perf_counter()-start, latencies
+
+
+def peak_memory(path, concurrency):
+    tracemalloc.start()
+    try:
+        run(path, concurrency, concurrency)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def first_item_id():
+    response = ogcapi_f.app.test_client().get("/collections/%s/items?npoints=1&limit=1&observedPropertyName=%s"%(COLLECTION, LAYERS[0]))
+    features = json.loads(response.get_data()).get("features", [])
+    if features:
+        return features[0]["id"]
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API benchmark suite against a stub WMS")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds added to every getPointValue call")
+    parser.add_argument("--timesteps", type=int, default=48)
+    parser.add_argument("--members", type=int, default=0, help="values of an extra member dimension per layer, 0 for none")
+    parser.add_argument("--requests", type=int, default=50, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--npoints", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--limit", type=int, nargs="+", default=[10, 100])
+    parser.add_argument("--parameters", type=int, nargs="+", default=[1, 3])
+    parser.add_argument("--cold", action="store_true", help="disable the point value cache")
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    a = parser.parse_args()
+
+    dims = {}
+    if a.members:
+        dims = {"member": [str(m) for m in range(a.members)]}
+    stub = StubWMS(layers=dict((layer, dims) for layer in LAYERS), timesteps=a.timesteps, latency=a.latency).start()
+    # Only the stub collection, /collections must not go to the real services
+    ogcapi_f.registry.interval = 0
+    ogcapi_f.registry.replace([{
+        "name": COLLECTION,
+        "title": "Benchmark",
+        "url": "/"+COLLECTION,
+        "service": stub.url,
+        "extent": [0.0, 48.0, 11.0, 56.0],
+    }])
+    if a.cold:
+        ogcapi_f.point_cache.max_bytes = 0
+
+    item_store_bytes = ogcapi_f.item_store.max_bytes
+
+    def start_scenario(name, path):
+        # Nothing is stored before a scenario; "item" never finds its
+        # feature in the item store, "item stored" always does
+        ogcapi_f.point_cache.clear()
+        ogcapi_f.item_store.clear()
+        ogcapi_f.item_store.max_bytes = 0 if name == "item" else item_store_bytes
+        if name == "item stored":
+            run(path, 1, 1)
+
+    results = []
+    try:
+        item_id = first_item_id()
+        for name, path in scenarios(item_id, a.npoints, a.limit, a.parameters):
+            start_scenario(name, path)
+            stub.reset()
+            elapsed, latencies = run(path, a.requests, a.concurrency)
+            calls = dict(stub.calls)
+            start_scenario(name, path)
+            memory = peak_memory(path, a.concurrency)
+            results.append({
+                "scenario": name,
+                "path": path,
+                "requests": a.requests,
+                "concurrency": a.concurrency,
+                "throughput_rps": round(a.requests/elapsed, 2),
+                "p50_ms": round(percentile(latencies, 50)*1000, 2),
+                "p95_ms": round(percentile(latencies, 95)*1000, 2),
+                "p99_ms": round(percentile(latencies, 99)*1000, 2),
+                "upstream_calls": calls.get("getpointvalue", 0),
+                "capabilities_calls": calls.get("getcapabilities", 0),
+                "peak_memory_kb": memory//1024,
+            })
+            print(name, results[-1]["throughput_rps"], "req/s", file=sys.stderr)
+    finally:
+        stub.stop()
+
+    report = {
+        "python": platform.python_version(),
+        "json_backend": serialization.BACKEND,
+        "settings": {
+            "latency": a.latency,
+            "timesteps": a.timesteps,
+            "members": a.members,
+            "cold": a.cold,
+        },
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "results": results,
+    }
+    if a.output:
+        with open(a.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
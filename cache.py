@@ -0,0 +1,297 @@
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import serialization
+
+log = logging.getLogger("ogcapi_f")
+
+
+class SingleFlight:
+    """Run a function at most once at a time per key.
+
+    Concurrent callers with the same key wait for the call already in
+    flight and share its result (or its exception). misses counts the
+    calls made, hits the callers that shared one and waiters the callers
+    waiting right now.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.hits = 0
+        self.misses = 0
+        self.waiters = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = {"event": threading.Event(), "result": None, "error": None}
+                self._calls[key] = call
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.waiters += 1
+
+        if not leader:
+            call["event"].wait()
+            with self._lock:
+                self.waiters -= 1
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"]
+
+        try:
+            call["result"] = fn()
+        except Exception as e:
+            call["error"] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call["event"].set()
+        return call["result"]
+
+    def in_flight(self, key):
+        with self._lock:
+            return key in self._calls
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "waiters": self.waiters}
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines on one event loop.
+
+    The call runs in its own task, so a caller that is cancelled (e.g. by
+    its deadline) does not cancel the call for the others.
+    """
+    def __init__(self):
+        self._calls = {}
+        self.hits = 0
+        self.misses = 0
+        self.waiters = 0
+
+    async def do(self, key, fn):
+        task = self._calls.get(key)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+            return await asyncio.shield(task)
+
+        self.hits += 1
+        self.waiters += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self.waiters -= 1
+
+    def _done(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # Mark the exception retrieved when every caller gave up
+            task.exception()
+
+    def in_flight(self, key):
+        return key in self._calls
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "waiters": self.waiters}
+
+
+class TTLCache:
+    """Small LRU cache with a time to live per entry.
+
+    Entries younger than ttl are served as is. Entries older than ttl but
+    younger than ttl+stale_ttl are served stale while one background thread
+    reloads them. Misses are loaded synchronously, with concurrent misses
+    for the same key sharing one load.
+    """
+    def __init__(self, ttl=300, maxsize=32, stale_ttl=3600):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.stale_ttl = stale_ttl
+        self._ttls = {}
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._flight = SingleFlight()
+
+    def set_ttl(self, key, ttl):
+        """ttl of one key instead of the default, None for the default."""
+        if ttl is None:
+            self._ttls.pop(key, None)
+        else:
+            self._ttls[key] = ttl
+
+    def get(self, key, loader):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+
+        if entry is not None:
+            value, stored = entry
+            age = now - stored
+            ttl = self._ttls.get(key, self.ttl)
+            if age < ttl:
+                return value
+            if age < ttl + self.stale_ttl:
+                self._refresh_in_background(key, loader)
+                return value
+
+        return self._flight.do(key, lambda: self._load(key, loader))
+
+    def peek(self, key):
+        """Value of key however old, or None; never loads it."""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return None
+        return entry[0]
+
+    def put(self, key, value, stale=False):
+        """Store value; a stale one is served while it is reloaded on its
+        first get()."""
+        stored = time.monotonic()
+        if stale:
+            stored -= self._ttls.get(key, self.ttl)
+        with self._lock:
+            self._entries[key] = (value, stored)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def _load(self, key, loader):
+        value = loader(key)
+        self.put(key, value)
+        return value
+
+    def _refresh_in_background(self, key, loader):
+        if self._flight.in_flight(key):
+            return
+
+        def refresh():
+            try:
+                self._flight.do(key, lambda: self._load(key, loader))
+            except Exception:
+                # Keep serving the stale entry, the next request retries
+                log.exception("Background refresh of %s failed", key)
+
+        t = threading.Thread(target=refresh, daemon=True)
+        t.start()
+
+
+class ResponseCache:
+    """LRU cache of decoded upstream responses, bounded by size in bytes.
+
+    Every entry has its own time to live, None meaning it never expires.
+    When directory is set, entries that never expire are also written there
+    as JSON files and read back on a memory miss, so they survive restarts.
+    """
+    def __init__(self, max_bytes=64*1024*1024, directory=None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, size, expires = entry
+                if expires is None or expires > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._remove(key)
+
+        if self.directory is not None:
+            value, size = self._read(key)
+            if value is not None:
+                self._store(key, value, size, None)
+                with self._lock:
+                    self.hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, value, size, ttl=None):
+        expires = None
+        if ttl is not None:
+            expires = time.monotonic()+ttl
+        self._store(key, value, size, expires)
+        if ttl is None and self.directory is not None:
+            self._write(key, value)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def _store(self, key, value, size, expires):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, expires)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+
+    def _remove(self, key):
+        value, size, expires = self._entries.pop(key)
+        self.bytes -= size
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode("utf-8")).hexdigest()+".json")
+
+    def _read(self, key):
+        try:
+            with open(self._path(key), "rb") as f:
+                content = f.read()
+        except OSError:
+            return None, 0
+        try:
+            stored = serialization.loads(content)
+        except ValueError:
+            return None, 0
+        if stored.get("key") != key:
+            return None, 0
+        return stored["value"], len(content)
+
+    def _write(self, key, value):
+        path = self._path(key)
+        tmp = "%s.%d.tmp"%(path, threading.get_ident())
+        try:
+            with open(tmp, "wb") as f:
+                f.write(serialization.dumpb({"key": key, "value": value}))
+            os.replace(tmp, path)
+        except OSError as e:
+            log.warning("Writing cache file %s failed: %s", path, e)
@@ -0,0 +1,58 @@
+import hashlib
+from datetime import datetime, timezone
+
+from flask import Response
+from werkzeug.http import is_resource_modified, http_date
+
+
+def make_etag(*parts):
+    """Strong entity tag (unquoted) from the parts that determine a response."""
+    h = hashlib.sha1()
+    for part in parts:
+        h.update(repr(part).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def parse_time(value):
+    """datetime of an ISO8601 dimension value like 2021-06-20T09:00:00Z, or None."""
+    for fmt in ("%Y-%m-%dT%H:%M:%SZ", "%Y-%m-%dT%H:%M:%S.%fZ", "%Y-%m-%dT%H:%MZ", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value, fmt).replace(tzinfo=timezone.utc)
+        except (TypeError, ValueError):
+            pass
+    return None
+
+
+def caching_headers(max_age, etag=None, last_modified=None):
+    headers = {}
+    if max_age > 0:
+        headers["Cache-Control"] = "public, max-age=%d"%(max_age,)
+    else:
+        headers["Cache-Control"] = "no-cache"
+    if etag is not None:
+        headers["ETag"] = '"%s"'%(etag,)
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+
+def not_modified(request, max_age, etag=None, last_modified=None):
+    """304 response when the client already has this version, else None.
+
+    Decided from the request headers only, so it can run before any
+    upstream call.
+    """
+    if etag is None and last_modified is None:
+        return None
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        return None
+    return Response(status=304, headers=caching_headers(max_age, etag, last_modified))
+
+
+def make_conditional(request, response, max_age):
+    """Add an ETag from the body of a buffered response, plus Cache-Control,
+    and turn it into a 304 when the client already has it."""
+    response.headers["Cache-Control"] = caching_headers(max_age)["Cache-Control"]
+    response.add_etag()
+    return response.make_conditional(request)
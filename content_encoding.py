@@ -0,0 +1,91 @@
+"""Response compression negotiated with Accept-Encoding.
+
+gzip is always available, br and zstd when the brotli and zstandard
+packages are installed. Buffered bodies are compressed in one go (and
+can be kept compressed in a cache), streamed bodies chunk by chunk with a
+flush after every chunk so the client still gets every feature right away.
+"""
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def available():
+    """Encodings in order of preference."""
+    encodings = []
+    if zstandard is not None:
+        encodings.append("zstd")
+    if brotli is not None:
+        encodings.append("br")
+    encodings.append("gzip")
+    return encodings
+
+
+def negotiate(accept_encodings, allowed=None):
+    """Best encoding for a werkzeug Accept-Encoding header, or None."""
+    offers = [e for e in available() if allowed is None or e in allowed]
+    best = accept_encodings.best_match(offers)
+    if best is None or accept_encodings[best] <= 0:
+        return None
+    return best
+
+
+class Compressor:
+    """Incremental compressor with the same interface for every encoding."""
+    def __init__(self, encoding, level):
+        self.encoding = encoding
+        if encoding == "gzip":
+            self._c = zlib.compressobj(level, zlib.DEFLATED, 31)
+        elif encoding == "br":
+            self._c = brotli.Compressor(quality=level)
+        elif encoding == "zstd":
+            self._c = zstandard.ZstdCompressor(level=level).compressobj()
+        else:
+            raise ValueError("Unsupported encoding %s"%(encoding,))
+
+    def compress(self, data):
+        if self.encoding == "br":
+            return self._c.process(data)
+        return self._c.compress(data)
+
+    def flush(self):
+        """Everything compressed so far, keeping the stream open."""
+        if self.encoding == "gzip":
+            return self._c.flush(zlib.Z_SYNC_FLUSH)
+        if self.encoding == "br":
+            return self._c.flush()
+        return self._c.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        if self.encoding == "br":
+            return self._c.finish()
+        return self._c.flush()
+
+
+def compress(data, encoding, level):
+    c = Compressor(encoding, level)
+    return c.compress(data)+c.finish()
+
+
+def compress_chunks(chunks, encoding, level):
+    """Compress an iterable of bytes or str chunks, flushing after each."""
+    c = Compressor(encoding, level)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            if chunk:
+                out = c.compress(chunk)+c.flush()
+                if out:
+                    yield out
+        yield c.finish()
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
@@ -0,0 +1,89 @@
+"""CoverageJSON encoding of items.
+
+Features of the same parameter, extra dimension values and time steps are
+put in one MultiPointSeries coverage: the time axis is written once and the
+results of all its points are one NdArray of shape [t, points].
+"""
+MEDIA_TYPE = "application/prs.coverage+json"
+
+CRS84 = "http://www.opengis.net/def/crs/OGC/1.3/CRS84"
+
+REFERENCING = [
+    {"coordinates": ["x", "y"], "system": {"type": "GeographicCRS", "id": CRS84}},
+    {"coordinates": ["t"], "system": {"type": "TemporalRS", "calendar": "Gregorian"}},
+]
+
+
+def group_key(feature):
+    properties = feature["properties"]
+    dims = tuple(sorted(properties.get("dims", {}).items()))
+    return properties["observedPropertyName"], dims, tuple(properties["timestep"])
+
+
+def coverage(features):
+    properties = features[0]["properties"]
+    name = properties["observedPropertyName"]
+    timesteps = properties["timestep"]
+    values = []
+    for t in range(len(timesteps)):
+        for feature in features:
+            values.append(feature["properties"]["result"][t])
+    result = {
+        "type": "Coverage",
+        "domain": {
+            "type": "Domain",
+            "domainType": "MultiPointSeries",
+            "axes": {
+                "t": {"values": timesteps},
+                "composite": {
+                    "dataType": "tuple",
+                    "coordinates": ["x", "y"],
+                    "values": [f["geometry"]["coordinates"] for f in features],
+                },
+            },
+            "referencing": REFERENCING,
+        },
+        "ranges": {
+            name: {
+                "type": "NdArray",
+                "dataType": "float",
+                "axisNames": ["t", "composite"],
+                "shape": [len(timesteps), len(features)],
+                "values": values,
+            },
+        },
+        "ids": [f["id"] for f in features],
+    }
+    if "dims" in properties:
+        result["dims"] = properties["dims"]
+    return result
+
+
+def coverage_collection(features):
+    """CoverageCollection of GeoJSON features of feature_from_dat().
+
+    Their timestep lists the time step of every result, so features with
+    missing values end up in a coverage of their own time steps.
+    """
+    groups = {}
+    coverages = []
+    for feature in features:
+        key = group_key(feature)
+        if key not in groups:
+            groups[key] = []
+            coverages.append(groups[key])
+        groups[key].append(feature)
+
+    parameters = {}
+    for feature in features:
+        name = feature["properties"]["observedPropertyName"]
+        if name not in parameters:
+            parameters[name] = {
+                "type": "Parameter",
+                "observedProperty": {"label": {"en": name}},
+            }
+    return {
+        "type": "CoverageCollection",
+        "parameters": parameters,
+        "coverages": [coverage(c) for c in coverages],
+    }
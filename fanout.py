@@ -0,0 +1,122 @@
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+def remaining(deadline, cap=None):
+    """Seconds left until deadline, optionally capped (e.g. by a per call timeout)."""
+    if deadline is None:
+        return cap
+    left = max(deadline - time.monotonic(), 0.001)
+    if cap is not None:
+        return min(left, cap)
+    return left
+
+
+class FanOut:
+    """Bounded concurrency fan-out of blocking upstream calls.
+
+    All collections share one thread pool of max_workers threads. On top of
+    that every key (collection) gets at most `limit` calls in flight, so one
+    busy collection can not claim the whole pool. Calls run in a copy of
+    the caller's contextvars context.
+    """
+    def __init__(self, max_workers=32, limit=8):
+        self.max_workers = max_workers
+        self.limit = limit
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fanout")
+        self._lock = threading.Lock()
+        self._semaphores = {}
+
+    def set_limit(self, key, limit):
+        with self._lock:
+            self._semaphores[key] = threading.BoundedSemaphore(limit)
+
+    def _semaphore(self, key):
+        with self._lock:
+            if key not in self._semaphores:
+                self._semaphores[key] = threading.BoundedSemaphore(self.limit)
+            return self._semaphores[key]
+
+    def map(self, key, fn, items, deadline=None):
+        """Call fn on every item and return the results in item order.
+
+        Raises DeadlineExceeded when the results are not all in before the
+        deadline (a time.monotonic() value); calls not started yet are
+        cancelled. Exceptions raised by fn are re-raised.
+        """
+        return list(self.imap(key, fn, items, deadline))
+
+    def imap(self, key, fn, items, deadline=None):
+        """Like map(), yielding every result as soon as it and all results
+        before it are in."""
+        # A single call takes the same path, so the per key limit and the
+        # deadline hold for it too
+        items = list(items)
+        semaphore = self._semaphore(key)
+        context = contextvars.copy_context()
+        futures = []
+        lock = threading.RLock()
+        local = threading.local()
+        closed = []
+
+        def done(future):
+            semaphore.release()
+            # A call that finishes right away runs this inside pump()
+            if not getattr(local, "pumping", False):
+                pump()
+
+        def start_next():
+            try:
+                future = self._executor.submit(context.copy().run, fn, items[len(futures)])
+            except Exception:
+                semaphore.release()
+                raise
+            futures.append(future)
+            future.add_done_callback(done)
+
+        def pump():
+            # Start as many calls as there are free slots, without blocking
+            with lock:
+                local.pumping = True
+                try:
+                    while not closed and len(futures) < len(items):
+                        if not semaphore.acquire(blocking=False):
+                            return
+                        start_next()
+                finally:
+                    local.pumping = False
+
+        try:
+            pump()
+            for i in range(len(items)):
+                with lock:
+                    waiting = len(futures) <= i
+                if waiting:
+                    # All slots are taken by other requests, wait for one
+                    if not semaphore.acquire(timeout=remaining(deadline)):
+                        raise DeadlineExceeded()
+                    with lock:
+                        local.pumping = True
+                        try:
+                            if len(futures) <= i:
+                                start_next()
+                            else:
+                                semaphore.release()
+                        finally:
+                            local.pumping = False
+                try:
+                    result = futures[i].result(timeout=remaining(deadline))
+                except TimeoutError:
+                    raise DeadlineExceeded()
+                yield result
+        finally:
+            with lock:
+                closed.append(True)
+                for f in futures:
+                    f.cancel()
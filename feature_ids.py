@@ -0,0 +1,99 @@
+"""Feature ids.
+
+An id holds everything needed to fetch its feature again: the layer, the
+point, the values of the other dimensions and the first and last time
+step, as
+
+    1~<layer>~<lon>,<lat>~<dim>=<value>~...~<first>~<last>
+
+Instants are written in the basic ISO 8601 format (20211017T060000Z) to
+keep ids short. Fields with other characters than letters, digits and
+_.-,:+ are base64url encoded behind a "!", so ids are safe in a URL path
+as they are. The leading version allows changing the format later; ids of
+the older collection;layer;lon,lat;dim=value;...;first$last format are
+still read.
+"""
+import base64
+import re
+
+VERSION = "1"
+SEPARATOR = "~"
+
+PLAIN = re.compile(r"[A-Za-z0-9_.,:+\-]*\Z")
+INSTANT = re.compile(r"(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)Z\Z")
+BASIC_INSTANT = re.compile(r"(\d{4})(\d\d)(\d\d)T(\d\d)(\d\d)(\d\d)Z\Z")
+
+
+def encode_field(value):
+    value = INSTANT.sub(r"\1\2\3T\4\5\6Z", value)
+    if PLAIN.match(value):
+        return value
+    return "!"+base64.urlsafe_b64encode(value.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_field(value):
+    if value.startswith("!"):
+        value = value[1:]
+        value = base64.urlsafe_b64decode(value+"="*(-len(value) % 4)).decode("utf-8")
+    return BASIC_INSTANT.sub(r"\1-\2-\3T\4:\5:\6Z", value)
+
+
+def prefix(layer, lon, lat):
+    """Start of the ids of the features of one getPointValue entry."""
+    return SEPARATOR.join([VERSION, encode_field(layer), "%s,%s"%(encode_field(lon), encode_field(lat))])
+
+
+def dims_part(dims):
+    """Id part of (name, value) pairs of the dimensions other than time."""
+    return "".join("%s%s=%s"%(SEPARATOR, encode_field(name), encode_field(value)) for name, value in dims)
+
+
+def suffix(first, last):
+    return "%s%s%s%s"%(SEPARATOR, encode_field(first), SEPARATOR, encode_field(last))
+
+
+def with_point(featureid, lon, lat):
+    """featureid with its point replaced by lon, lat."""
+    terms = featureid.split(SEPARATOR)
+    terms[2] = "%s,%s"%(encode_field(lon), encode_field(lat))
+    return SEPARATOR.join(terms)
+
+
+def encode(layer, lon, lat, dims, first, last):
+    return prefix(layer, lon, lat)+dims_part(dims)+suffix(first, last)
+
+
+def decode(featureid):
+    """{"layer", "lon", "lat", "dims": [(name, value), ...], "first", "last"}
+    of an id. Raises ValueError when it is not a feature id."""
+    try:
+        if featureid.startswith(VERSION+SEPARATOR):
+            terms = featureid.split(SEPARATOR)
+            if len(terms) < 5:
+                raise ValueError("too few fields")
+            layer, point, dims, times = terms[1], terms[2], terms[3:-2], terms[-2:]
+        else:
+            # The old format
+            terms = featureid.split(";")
+            if len(terms) < 4:
+                raise ValueError("too few fields")
+            layer, point, dims, times = terms[1], terms[2], terms[3:-1], terms[-1].split("$")
+            if len(times) != 2:
+                raise ValueError("no time range")
+        lon, lat = point.split(",")
+        pairs = [term.split("=") for term in dims]
+        if any(len(pair) != 2 for pair in pairs):
+            raise ValueError("dimensions are not name=value")
+        first, last = decode_field(times[0]), decode_field(times[1])
+        if not INSTANT.match(first) or not INSTANT.match(last):
+            raise ValueError("the time range is not two instants")
+        return {
+            "layer": decode_field(layer),
+            "lon": decode_field(lon),
+            "lat": decode_field(lat),
+            "dims": [(decode_field(name), decode_field(value)) for name, value in pairs],
+            "first": first,
+            "last": last,
+        }
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("%s is not a feature id: %s"%(featureid, e))
@@ -0,0 +1,114 @@
+import math
+
+WMS_NS = "{http://www.opengis.net/wms}"
+
+# CRS with lon/lat axis order, and EPSG:4326 which is lat/lon in WMS 1.3
+LONLAT_CRS = ["CRS:84"]
+LATLON_CRS = ["EPSG:4326"]
+
+
+class Grid:
+    """Regular lon/lat grid of cells of resx by resy degrees.
+
+    The cell index of a point is computed directly from its offset to the
+    lower left corner of the bounding box, so snapping is O(1) per point.
+    """
+    def __init__(self, minx, miny, maxx, maxy, resx, resy):
+        self.minx = minx
+        self.miny = miny
+        self.maxx = maxx
+        self.maxy = maxy
+        self.resx = resx
+        self.resy = resy
+        self.nx = max(int(round((maxx-minx)/resx)), 1)
+        self.ny = max(int(round((maxy-miny)/resy)), 1)
+
+    @classmethod
+    def from_list(cls, values):
+        """Grid from [minx, miny, maxx, maxy, resx, resy]."""
+        return cls(*[float(v) for v in values])
+
+    @classmethod
+    def from_config(cls, config):
+        """Grid of a collection's "grid": {"bbox": [...], "resolution": [resx, resy]}."""
+        bbox = config["bbox"]
+        resx, resy = config["resolution"]
+        return cls(bbox[0], bbox[1], bbox[2], bbox[3], resx, resy)
+
+    def to_list(self):
+        return [self.minx, self.miny, self.maxx, self.maxy, self.resx, self.resy]
+
+    def cell(self, lon, lat):
+        """(i, j) of the cell containing lon, lat, or None outside the grid."""
+        if not (self.minx <= lon <= self.maxx and self.miny <= lat <= self.maxy):
+            return None
+        # Points on the upper and right edges belong to the last cells
+        i = min(int(math.floor((lon-self.minx)/self.resx)), self.nx-1)
+        j = min(int(math.floor((lat-self.miny)/self.resy)), self.ny-1)
+        return i, j
+
+    def snap(self, lon, lat):
+        """Center of the cell containing lon, lat; the point itself when it
+        is outside the grid."""
+        cell = self.cell(lon, lat)
+        if cell is None:
+            return lon, lat
+        i, j = cell
+        return self.minx+(i+0.5)*self.resx, self.miny+(j+0.5)*self.resy
+
+    def centers(self, bbox, max_points):
+        """Centers of the cells overlapping bbox [minx, miny, maxx, maxy],
+        lon by lon. Every so many cells is skipped along both axes to
+        return at most max_points."""
+        if bbox[2] < self.minx or bbox[0] > self.maxx or bbox[3] < self.miny or bbox[1] > self.maxy:
+            return []
+        # Cells that only touch the upper or right edge of bbox are left out
+        i0 = min(int(math.floor((max(bbox[0], self.minx)-self.minx)/self.resx)), self.nx-1)
+        j0 = min(int(math.floor((max(bbox[1], self.miny)-self.miny)/self.resy)), self.ny-1)
+        i1 = max(min(int(math.ceil((min(bbox[2], self.maxx)-self.minx)/self.resx))-1, self.nx-1), i0)
+        j1 = max(min(int(math.ceil((min(bbox[3], self.maxy)-self.miny)/self.resy))-1, self.ny-1), j0)
+        stride = 1
+        while ((i1-i0)//stride+1)*((j1-j0)//stride+1) > max_points:
+            stride += 1
+        return [[self.minx+(i+0.5)*self.resx, self.miny+(j+0.5)*self.resy]
+                for i in range(i0, i1+1, stride) for j in range(j0, j1+1, stride)]
+
+
+def grids_from_capabilities(xml):
+    """Grid of every named layer with a lon/lat BoundingBox with resx/resy
+    in a WMS 1.3 GetCapabilities document, as {layer name: Grid}.
+
+    Nested layers inherit the bounding boxes of their parents.
+    """
+    grids = {}
+
+    def bbox_grid(layer, inherited):
+        for bbox in layer.findall(WMS_NS+"BoundingBox"):
+            crs = bbox.attrib.get("CRS")
+            if "resx" not in bbox.attrib or "resy" not in bbox.attrib:
+                continue
+            values = [float(bbox.attrib[k]) for k in ("minx", "miny", "maxx", "maxy", "resx", "resy")]
+            if values[4] <= 0 or values[5] <= 0:
+                continue
+            if crs in LONLAT_CRS:
+                return Grid(*values)
+            if crs in LATLON_CRS:
+                miny, minx, maxy, maxx, resy, resx = values
+                return Grid(minx, miny, maxx, maxy, resx, resy)
+        return inherited
+
+    def walk(layer, inherited):
+        grid = bbox_grid(layer, inherited)
+        name = layer.find(WMS_NS+"Name")
+        if name is not None and name.text and grid is not None:
+            grids[name.text.strip()] = grid
+        for child in layer.findall(WMS_NS+"Layer"):
+            walk(child, grid)
+
+    from defusedxml.ElementTree import fromstring
+    root = fromstring(xml)
+    capability = root.find(WMS_NS+"Capability")
+    if capability is not None:
+        for layer in capability.findall(WMS_NS+"Layer"):
+            walk(layer, None)
+    return grids
@@ -0,0 +1,72 @@
+import logging
+import threading
+import time
+
+log = logging.getLogger("ogcapi_f")
+
+
+class MetadataRegistry:
+    """Prebuilt collection documents, refreshed in the background.
+
+    build(name) makes the document of one collection. All documents are
+    built on first use and then rebuilt every interval seconds by a daemon
+    thread. Readers get the current snapshot, a dict that is never changed
+    after it is published; a refresh publishes a new one.
+    """
+    def __init__(self, names, build, interval=300):
+        self.names = list(names)
+        self.build = build
+        self.interval = interval
+        self._snapshot = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def snapshot(self):
+        if not self._snapshot:
+            with self._lock:
+                if not self._snapshot:
+                    self.refresh()
+            self.start()
+        return self._snapshot
+
+    def get(self, name):
+        snapshot = self.snapshot()
+        if name in snapshot:
+            return snapshot[name]
+        # Failed in the last refresh (or a new name): build it now
+        document = self.build(name)
+        self._publish({**self._snapshot, name: document})
+        return document
+
+    def discard(self, name):
+        """Drop a document, it is built again on its next get()."""
+        with self._lock:
+            self._publish(dict((k, v) for k, v in self._snapshot.items() if k != name))
+
+    def refresh(self):
+        snapshot = {}
+        for name in self.names:
+            try:
+                snapshot[name] = self.build(name)
+            except Exception:
+                log.exception("Building metadata of %s failed", name)
+                if name in self._snapshot:
+                    snapshot[name] = self._snapshot[name]
+        self._publish(snapshot)
+
+    def _publish(self, snapshot):
+        self._snapshot = snapshot
+
+    def start(self):
+        if self._thread is not None or self.interval <= 0:
+            return
+
+        def run():
+            while True:
+                time.sleep(self.interval)
+                self.refresh()
+
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=run, name="metadata-refresh", daemon=True)
+                self._thread.start()
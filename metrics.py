@@ -0,0 +1,161 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Histogram buckets in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_current = contextvars.ContextVar("timings", default=None)
+
+
+def escape(value):
+    """Label value escaped for the text exposition format."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels):
+    return ",".join('%s="%s"'%(k, escape(v)) for k, v in labels)
+
+
+class Histograms:
+    """Prometheus style histograms of seconds, one per set of label values."""
+    def __init__(self, name, help, labels, buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, values, seconds):
+        with self._lock:
+            series = self._series.get(values)
+            if series is None:
+                series = {"buckets": [0]*len(self.buckets), "sum": 0.0, "count": 0}
+                self._series[values] = series
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series["buckets"][i] += 1
+            series["sum"] += seconds
+            series["count"] += 1
+
+    def render(self):
+        """Lines in the Prometheus text exposition format."""
+        lines = [
+            "# HELP %s %s"%(self.name, self.help),
+            "# TYPE %s histogram"%(self.name,),
+        ]
+        with self._lock:
+            series = sorted((values, {**s, "buckets": list(s["buckets"])}) for values, s in self._series.items())
+        for values, s in series:
+            labels = format_labels(zip(self.labels, values))
+            for bound, count in zip(self.buckets, s["buckets"]):
+                lines.append('%s_bucket{%s,le="%s"} %d'%(self.name, labels, bound, count))
+            lines.append('%s_bucket{%s,le="+Inf"} %d'%(self.name, labels, s["count"]))
+            lines.append("%s_sum{%s} %f"%(self.name, labels, s["sum"]))
+            lines.append("%s_count{%s} %d"%(self.name, labels, s["count"]))
+        return lines
+
+
+class Timings:
+    """Time spent per phase while serving one request.
+
+    Phases can be timed from other threads (see fanout.FanOut), so adding
+    is locked. A phase that runs more than once is summed.
+    """
+    def __init__(self, collection=""):
+        self.collection = collection
+        self.start = time.perf_counter()
+        self._lock = threading.Lock()
+        self._phases = {}
+
+    def add(self, phase, seconds):
+        with self._lock:
+            total, count = self._phases.get(phase, (0.0, 0))
+            self._phases[phase] = (total+seconds, count+1)
+
+    def elapsed(self):
+        return time.perf_counter()-self.start
+
+    def phases(self):
+        with self._lock:
+            return dict(self._phases)
+
+    def server_timing(self):
+        """Value of a Server-Timing header, durations in milliseconds."""
+        entries = []
+        for phase, (total, count) in self.phases().items():
+            entry = "%s;dur=%.1f"%(phase, total*1000)
+            if count > 1:
+                entry += ';desc="%d calls"'%(count,)
+            entries.append(entry)
+        entries.append("total;dur=%.1f"%(self.elapsed()*1000))
+        return ", ".join(entries)
+
+
+phase_seconds = Histograms("ogcapi_phase_seconds", "Seconds spent per collection and request phase", ("collection", "phase"))
+
+
+# Functions returning more samples for /metrics, see register()
+_collectors = []
+
+
+def register(collector):
+    """Add counters or gauges to /metrics. collector() returns a list of
+    (name, type, help, labels, value) with labels a dict."""
+    _collectors.append(collector)
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    lines = phase_seconds.render()
+    families = {}
+    for collector in _collectors:
+        for name, type, help, labels, value in collector():
+            if name not in families:
+                families[name] = [
+                    "# HELP %s %s"%(name, help),
+                    "# TYPE %s %s"%(name, type),
+                ]
+            if labels:
+                families[name].append("%s{%s} %s"%(name, format_labels(sorted(labels.items())), value))
+            else:
+                families[name].append("%s %s"%(name, value))
+    for family in families.values():
+        lines.extend(family)
+    return "\n".join(lines)+"\n"
+
+
+def start(collection=""):
+    """Start timing the request running in the current context."""
+    timings = Timings(collection)
+    _current.set(timings)
+    return timings
+
+
+def stop():
+    _current.set(None)
+
+
+def current():
+    return _current.get()
+
+
+def record(phase, seconds, collection=None):
+    timings = _current.get()
+    if timings is not None:
+        timings.add(phase, seconds)
+        if collection is None:
+            collection = timings.collection
+    phase_seconds.observe((collection or "", phase), seconds)
+
+
+@contextmanager
+def timed(phase, collection=None):
+    """Time the block as phase of the current request and in phase_seconds."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(phase, time.perf_counter()-start, collection)
@@ -1,52 +1,116 @@
 import os
-from flask import Flask, request, Response, render_template
+import logging
+import random
+import hashlib
+from flask import Flask, request, Response, render_template, stream_with_context, g
 import json
 from flask.typing import TemplateFilterCallable
 from flask_cors import CORS
 import copy
-from werkzeug.serving import WSGIRequestHandler
 import requests
-from collections import OrderedDict
 from functools import reduce
 from datetime import datetime
-from defusedxml.ElementTree import fromstring
 import itertools
 import re
+import time
 from pprint import pprint
-from apispec import APISpec
-from apispec_webframeworks.flask import FlaskPlugin
-from apispec.ext.marshmallow import MarshmallowPlugin
-from marshmallow import Schema, fields
 
-from owslib.wms import WebMapService
-import yaml
-from schemas.schemas import create_apispec
+from cache import TTLCache, ResponseCache, SingleFlight
+from metadata import MetadataRegistry
+from registry import CollectionRegistry
+from prefetch import Prefetcher, RateLimiter
+from conditional import make_etag, parse_time, caching_headers, not_modified, make_conditional
+from fanout import FanOut, DeadlineExceeded, remaining
+from paging import plan_page, features_per_point
+from grid import Grid, grids_from_capabilities
+from spatial import CRS84, parse_bbox, intersect
+from temporal import parse_interval, parse_datetime, format_datetime, time_extent, time_parameter
+import upstream
+import feature_ids
+import serialization
+import coveragejson
+import content_encoding
+import metrics
+from metrics import timed
 
 
 TIMEOUT=20
 
-EXTRA_SETTINGS = """
-servers:
-- url: http://192.168.178.113:5001/
-  description: The OGCAPI development server
-"""
-
-"""
-  variables:
-    port:
-      enum:
-      - '5000'
-      - '5001'
-      default: '5000'
-
-"""
-settings =  yaml.safe_load(EXTRA_SETTINGS)
-spec = create_apispec(
-        title="OGCAPI_F",
-        version="0.0.1",
-        openapi_version="3.0.2",
-        settings = settings
-        )
+# Debug output (upstream urls and payloads) is logged at DEBUG level. A
+# fraction TRACE_SAMPLE_RATE of the requests is logged with its phase timings
+LOG_LEVEL=os.environ.get("LOG_LEVEL", "WARNING").upper()
+TRACE_SAMPLE_RATE=float(os.environ.get("TRACE_SAMPLE_RATE", 0))
+
+logging.basicConfig(format="%(asctime)s %(name)s %(levelname)s %(message)s")
+log = logging.getLogger("ogcapi_f")
+log.setLevel(LOG_LEVEL)
+trace_log = logging.getLogger("ogcapi_f.trace")
+trace_log.setLevel(logging.INFO)
+
+# GetCapabilities results per collection: seconds fresh, seconds served stale
+# while refreshing in the background, and number of collections kept
+CAPABILITIES_TTL=int(os.environ.get("CAPABILITIES_TTL", 300))
+CAPABILITIES_STALE_TTL=int(os.environ.get("CAPABILITIES_STALE_TTL", 3600))
+CAPABILITIES_CACHE_SIZE=int(os.environ.get("CAPABILITIES_CACHE_SIZE", 32))
+METADATA_REFRESH_INTERVAL=int(os.environ.get("METADATA_REFRESH_INTERVAL", CAPABILITIES_TTL))
+
+# Parallel getPointValue calls: total worker threads, default number of calls
+# in flight per collection (override with "max_concurrency" in a collection)
+# and the maximum number of seconds an items request may spend upstream
+UPSTREAM_WORKERS=int(os.environ.get("UPSTREAM_WORKERS", 32))
+UPSTREAM_CONCURRENCY=int(os.environ.get("UPSTREAM_CONCURRENCY", 8))
+REQUEST_DEADLINE=float(os.environ.get("REQUEST_DEADLINE", 60))
+
+# Maximum number of layers combined in one getPointValue call, 1 disables
+# batching (override with "max_batch_layers" in a collection)
+MAX_BATCH_LAYERS=int(os.environ.get("MAX_BATCH_LAYERS", 8))
+
+# getPointValue response cache: memory size in bytes, seconds to keep results
+# of the latest model run, seconds to keep results of older (immutable) runs
+# (empty for forever) and optional directory for the immutable results
+POINT_CACHE_BYTES=int(os.environ.get("POINT_CACHE_BYTES", 64*1024*1024))
+POINT_CACHE_TTL=float(os.environ.get("POINT_CACHE_TTL", 300))
+POINT_CACHE_IMMUTABLE_TTL=float(os.environ["POINT_CACHE_IMMUTABLE_TTL"]) if os.environ.get("POINT_CACHE_IMMUTABLE_TTL") else None
+POINT_CACHE_DIR=os.environ.get("POINT_CACHE_DIR") or None
+
+# Features of items responses kept for requests by id: memory size in bytes
+# and seconds to keep them
+ITEM_STORE_BYTES=int(os.environ.get("ITEM_STORE_BYTES", 16*1024*1024))
+ITEM_STORE_TTL=float(os.environ.get("ITEM_STORE_TTL", POINT_CACHE_TTL))
+
+# Prefetch of new model runs into the getPointValue cache: seconds between
+# polls of the capabilities (0 disables), getPointValue calls per second,
+# the points (lon,lat separated by ;) and the grids of npoints by npoints
+# points (separated by ,) to warm. Collections can override these with
+# "prefetch": {"parameters": [...], "points": [[lon, lat], ...], "npoints": [...]},
+# without "parameters" all layers of a collection are warmed
+PREFETCH_INTERVAL=float(os.environ.get("PREFETCH_INTERVAL", 0))
+PREFETCH_RATE=float(os.environ.get("PREFETCH_RATE", 2))
+PREFETCH_POINTS=[[float(v) for v in p.split(",")] for p in os.environ.get("PREFETCH_POINTS", "5.2,52.0").split(";") if p]
+PREFETCH_NPOINTS=[int(n) for n in os.environ.get("PREFETCH_NPOINTS", "1").split(",") if n]
+
+# Collections are configured in COLLECTIONS_CONFIG (YAML or JSON), which is
+# checked for changes at most every COLLECTIONS_RELOAD_INTERVAL seconds (0
+# disables reloading)
+COLLECTIONS_CONFIG=os.environ.get("COLLECTIONS_CONFIG", os.path.join(os.path.dirname(os.path.abspath(__file__)), "collections.yaml"))
+COLLECTIONS_RELOAD_INTERVAL=float(os.environ.get("COLLECTIONS_RELOAD_INTERVAL", 5))
+
+registry = CollectionRegistry(COLLECTIONS_CONFIG, COLLECTIONS_RELOAD_INTERVAL)
+registry.load()
+collections = registry.collections
+coll_by_name = registry.by_name
+
+# OpenAPI document: prebuilt by prebuild.py in OPENAPI_FILE, or built from
+# the docstrings of api_views on first use. Cold starts (Lambda) do not
+# import apispec and marshmallow when the prebuilt document is there
+OPENAPI_FILE=os.environ.get("OPENAPI_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "openapi.json"))
+
+# Optional GetCapabilities results of all collections written by prebuild.py,
+# served (stale) until the first refresh
+CAPABILITIES_SNAPSHOT=os.environ.get("CAPABILITIES_SNAPSHOT", os.path.join(os.path.dirname(os.path.abspath(__file__)), "capabilities.json"))
+
+api_views = []
+openapi = {}
 
 SUPPORTED_CRS=[
     "http://www.opengis.net/def/crs/OGC/1.3/CRS84",
@@ -56,35 +120,141 @@ SUPPORTED_CRS=[
 app = Flask(import_name=__name__)
 cors=CORS(app)
 
-collections = [
-    {
-        "name": "precip",
-        "title": "precipitation",
-        "url": "/precip",
-        "service": "https://geoservices.knmi.nl/wms?DATASET=RADAR",
-        "extent": [0.000000, 48.895303, 10.85645, 55.97360]
-        #TODO Native projection?
-    },
-    {
-        "name": "harmonie",
-        "title": "Harmonie",
-        "url": "/harmonie",
-        "service": "https://geoservices.knmi.nl/wms?DATASET=HARM_N25",
-        "extent": [-0.018500, 48.988500, 11.081500, 55.888500]
-        #TODO Native projection?
-    # },
-    # {
-    #     "name": "MSG-CPP",
-    #     "title": "MSG-CPP",
-    #     "url": "/msg-cpp",
-    #     "service": "https://adaguc-server-msg-cpp-portal.pmc.knmi.cloud/wms?DATASET=msgrt",
-    #     "extent": [0, 45, 12, 57]
-    }
-]
+@app.before_request
+def start_timings():
+    # Only configured collections get their own series, any other name in
+    # the url would add one that is never freed
+    collection = ""
+    if request.view_args and request.view_args.get("coll") in coll_by_name:
+        collection = request.view_args["coll"]
+    g.timings = metrics.start(collection)
+
+@app.before_request
+def reload_collections():
+    registry.check()
+
+@app.before_request
+def check_collection():
+    # Collections come and go with the registry
+    coll = (request.view_args or {}).get("coll")
+    if coll is not None and coll not in coll_by_name:
+        return Response("Collection %s not found"%(coll,), 404)
+
+@app.before_request
+def start_prefetch():
+    # Not at import, so importing the app does not start threads
+    prefetcher.start()
+
+@app.after_request
+def add_server_timing(response):
+    timings = g.get("timings")
+    if timings is not None:
+        metrics.phase_seconds.observe((timings.collection, "request"), timings.elapsed())
+        response.headers["Server-Timing"] = timings.server_timing()
+        g.status = response.status_code
+    return response
+
+@app.after_request
+def compress_response(response):
+    # Registered after add_server_timing, so it runs before it
+    if response.status_code!=200 or "Content-Encoding" in response.headers or response.direct_passthrough:
+        return response
+    if response.mimetype not in COMPRESSIBLE_TYPES:
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = content_encoding.negotiate(request.accept_encodings, COMPRESS_ENCODINGS)
+    if encoding is None:
+        return response
+    level = COMPRESS_LEVELS[encoding]
 
-coll_by_name={}
+    if response.is_streamed:
+        response.response = content_encoding.compress_chunks(response.response, encoding, level)
+        response.headers.pop("Content-Length", None)
+    else:
+        body = response.get_data()
+        if len(body)<COMPRESS_MIN_SIZE:
+            return response
+        # Documents with a strong ETag are served over and over, compress
+        # them once. Keyed by the body itself: an ETag of the query (items)
+        # or a path alone (links of the requested host) does not pin it
+        etag, weak = response.get_etag()
+        key = None
+        if etag is not None and not weak:
+            key = "%s|%s"%(hashlib.sha1(body).hexdigest(), encoding)
+            compressed = compressed_cache.get(key)
+        if key is None or compressed is None:
+            with timed("compress"):
+                compressed = content_encoding.compress(body, encoding, level)
+            if key is not None:
+                compressed_cache.put(key, compressed, len(compressed), COMPRESSED_CACHE_TTL)
+        response.set_data(compressed)
+    response.headers["Content-Encoding"] = encoding
+    # The encoded body is another representation of the same resource
+    etag, weak = response.get_etag()
+    if etag is not None:
+        response.set_etag(etag, weak=True)
+    return response
+
+@app.teardown_request
+def finish_timings(exc):
+    timings = g.pop("timings", None)
+    metrics.stop()
+    if timings is not None and TRACE_SAMPLE_RATE>0 and random.random()<TRACE_SAMPLE_RATE:
+        trace_log.info(serialization.dumps({
+            "method": request.method,
+            "path": request.full_path,
+            "collection": timings.collection,
+            "status": g.get("status"),
+            "total_ms": round(timings.elapsed()*1000, 1),
+            "phases": dict((phase, {"ms": round(total*1000, 1), "calls": count}) for phase, (total, count) in timings.phases().items()),
+        }))
+
+# Response compression: encodings allowed (of zstd, br and gzip, the first
+# two when their packages are installed), the minimum size of a buffered
+# body, the level per encoding and the memory and seconds compressed
+# bodies with an ETag are kept
+COMPRESS_ENCODINGS=os.environ.get("COMPRESS_ENCODINGS", "zstd,br,gzip").split(",")
+COMPRESS_MIN_SIZE=int(os.environ.get("COMPRESS_MIN_SIZE", 1024))
+COMPRESS_LEVELS={
+    "gzip": int(os.environ.get("COMPRESS_GZIP_LEVEL", 6)),
+    "br": int(os.environ.get("COMPRESS_BR_LEVEL", 5)),
+    "zstd": int(os.environ.get("COMPRESS_ZSTD_LEVEL", 3)),
+}
+COMPRESSED_CACHE_BYTES=int(os.environ.get("COMPRESSED_CACHE_BYTES", 32*1024*1024))
+COMPRESSED_CACHE_TTL=int(os.environ.get("COMPRESSED_CACHE_TTL", 3600))
+COMPRESSIBLE_TYPES=["application/json", "application/geo+json", "application/prs.coverage+json",
+                    "application/openapi", "application/openapi+json", "application/openapi+yaml", "text/html", "text/plain"]
+
+# Cache-Control max-age per endpoint: items of a past model run, items of the
+# latest run, items without a model run, collection metadata and static documents
+ITEMS_IMMUTABLE_MAX_AGE=int(os.environ.get("ITEMS_IMMUTABLE_MAX_AGE", 86400))
+ITEMS_MAX_AGE=int(os.environ.get("ITEMS_MAX_AGE", 300))
+ITEMS_LIVE_MAX_AGE=int(os.environ.get("ITEMS_LIVE_MAX_AGE", 60))
+METADATA_MAX_AGE=int(os.environ.get("METADATA_MAX_AGE", 300))
+STATIC_MAX_AGE=int(os.environ.get("STATIC_MAX_AGE", 3600))
+
+# Sampling of a bbox requested without npoints: grid spacing in degrees for
+# collections without a known model grid, and the maximum number of points
+BBOX_SAMPLE_RESOLUTION=float(os.environ.get("BBOX_SAMPLE_RESOLUTION", 0.1))
+BBOX_MAX_POINTS=int(os.environ.get("BBOX_MAX_POINTS", 100))
+
+# Stream items responses: the FeatureCollection envelope goes out first and
+# every feature as soon as its upstream call is in
+STREAM_ITEMS=os.environ.get("STREAM_ITEMS", "0").lower() in ("1", "true", "yes")
+
+capabilities_cache = TTLCache(ttl=CAPABILITIES_TTL, maxsize=CAPABILITIES_CACHE_SIZE, stale_ttl=CAPABILITIES_STALE_TTL)
+if os.path.exists(CAPABILITIES_SNAPSHOT):
+    with open(CAPABILITIES_SNAPSHOT, "rb") as f:
+        for name, parameters in serialization.loads(f.read()).items():
+            if name in coll_by_name:
+                capabilities_cache.put(name, parameters, stale=True)
+
+fanout = FanOut(max_workers=UPSTREAM_WORKERS, limit=UPSTREAM_CONCURRENCY)
 for c in collections:
-    coll_by_name[c["name"]]=c
+    if "max_concurrency" in c:
+        fanout.set_limit(c["name"], c["max_concurrency"])
+    if "capabilities_ttl" in c:
+        capabilities_cache.set_ttl(c["name"], c["capabilities_ttl"])
 
 def makedims(dims, data):
     dimlist=[]
@@ -107,16 +277,16 @@ def makedims(dims, data):
 
     if len(dims)>=4:
         d4=list(dt[d1[0]][d2[0]][d3[0]].keys())
-        dimlist.append({dims[2]: d4})
+        dimlist.append({dims[3]: d4})
 
     if len(dims)>=5:
         d5=list(dt[d1[0]][d2[0]][d3[0]][d4[0]].keys())
-        dimlist.append({dims[2]: d5})
+        dimlist.append({dims[4]: d5})
 
     return dimlist
 
 def makelist(list):
-    if isinstance(list, OrderedDict):
+    if isinstance(list, dict):
         result = []
         for l in list.keys():
             result.append(makelist(list[l]))
@@ -138,50 +308,91 @@ def multi_get(dict_obj, attrs, default=None):
         result = result[attr]
     return result
 
-def request_by_id(url, name, headers=None, requested_id=None):
+def request_by_id_steps(url, name, item):
+    # request_by_id() without the I/O, see run_steps(). item is the decoded
+    # feature id, which pins every dimension, so one getPointValue call for
+    # its layer, point and time range gives the feature
     url = make_wms1_3(url)+"&request=getPointValue&INFO_FORMAT=application/json"
+    url = "%s&LAYERS=%s"%(url, item["layer"])
+    for dim_name, dim_value in item["dims"]:
+        if dim_name.lower() == "reference_time":
+            url = "%s&DIM_REFERENCE_TIME=%s"%(url, dim_value)
+        elif dim_name.lower() == "elevation":
+            url = "%s&ELEVATION=%s"%(url, dim_value)
+        else:
+            url = "%s&DIM_%s=%s"%(url, dim_name, dim_value)
 
-    if requested_id is not None:
-        # Get feature data for this id
-        terms = requested_id.split(";")
-        layer_name = terms[0]
-        observedPropertyName = terms[1]
-        url = "%s&LAYERS=%s"%(url, observedPropertyName)
-        lon, lat = terms[2].split(",")
-        for term in terms[3:-1]:
-            dim_name, dim_value = term.split("=")
-            if dim_name.lower() == "reference_time":
-                url = "%s&DIM_REFERENCE_TIME=%s"%(url, dim_value)
-            elif dim_name.lower() == "elevation":
-                url = "%s&ELEVATION=%s"%(url, dim_value)
-            else:
-                url = "%s&DIM_%s=%s"%(url, dim_name, dim_value)
+    url = "%s&X=%s&Y=%s&CRS=EPSG:4326"%(url, item.get("x", item["lon"]), item.get("y", item["lat"]))
+    url = "%s&TIME=%s/%s"%(url, item["first"], item["last"])
+    response = yield url, None
+    if response.status_code == 200:
+        log.debug("R: %s", response.content)
+        try:
+            with timed("decode"):
+                data = serialization.loads(response.content)
+        except ValueError:
+            from defusedxml.ElementTree import fromstring
+            root = fromstring(response.content.decode('utf-8'))
+            log.debug("ET: %s", root)
 
-        url = "%s&X=%s&Y=%s&CRS=EPSG:4326"%(url, lon, lat)
-        url = "%s&TIME=%s"%(url, "/".join(terms[-1].split("$")))
-        response = requests.get(url, headers=headers, timeout=TIMEOUT)
-        if response.status_code == 200:
-            print("R:", response.content)
-            try:
-                data = json.loads(response.content.decode('utf-8'), object_pairs_hook=OrderedDict)
-            except ValueError:
-                root = fromstring(response.content.decode('utf-8'))
-                print("ET:", root)
-
-                retval =  json.dumps({"Error":  { "code": root[0].attrib["code"], "message": root[0].text}})
-                print("retval=", retval)
-                return 400, root[0].text.strip(), None, None
-            dat = data[0]
-            item_feature = feature_from_dat(dat, observedPropertyName, name)
-            feature = item_feature[0]
-            feature["links"]=[
-                make_link(request.path, "self", "application/geo+json", "This document"),
-                make_link("", "alternate", "text/html", "This document in html"),
-                make_link("", "collection", "application/json", "Collection")
-            ]
-            return 200, json.dumps(feature), {'Content-Crs': "<http://www.opengis.net/def/crs/OGC/1.3/CRS84>"}
+            retval =  json.dumps({"Error":  { "code": root[0].attrib["code"], "message": root[0].text}})
+            log.debug("retval= %s", retval)
+            return 400, root[0].text.strip(), None, None
+        dat = data[0]
+        with timed("features"):
+            item_feature = feature_from_dat(dat, item["layer"], name)
+        # The requested point, which is not the one of the grid cell the
+        # upstream answers with for ids of snapped points
+        feature = {
+            **item_feature[0],
+            "id": feature_ids.encode(item["layer"], item["lon"], item["lat"], item["dims"], item["first"], item["last"]),
+            "geometry": {"type": "Point", "coordinates": [float(item["lon"]), float(item["lat"])]},
+        }
+        remember_items(name, [feature])
+        return item_document(feature)
     return 400, None, None
 
+def request_by_id(url, name, headers=None, item=None):
+    return run_steps(request_by_id_steps(url, name, item), headers)
+
+def item_document(feature):
+    # (status, body, headers) of a single feature
+    feature = {**feature}
+    feature["links"]=[
+        make_link(request.path, "self", "application/geo+json", "This document"),
+        make_link("", "alternate", "text/html", "This document in html"),
+        make_link("", "collection", "application/json", "Collection")
+    ]
+    return 200, serialization.dumpb(feature), {'Content-Crs': "<http://www.opengis.net/def/crs/OGC/1.3/CRS84>", 'Content-Type': "application/geo+json"}
+
+def remember_items(name, features):
+    # Served features, so a request for one of them by id needs no upstream call
+    for feature in features:
+        size = 256+16*len(feature["properties"]["result"])
+        item_store.put("%s|%s"%(name, feature["id"]), feature, size, ITEM_STORE_TTL)
+
+def stored_item(query):
+    """(status, body, headers) of the requested feature from item_store, or None."""
+    feature = item_store.get("%s|%s"%(query["coll_info"]["name"], query["featureid"]))
+    if feature is None:
+        return None
+    return item_document(feature)
+
+def results_rowwise(data, timeSteps, tuples):
+    # (values, time steps of the values) per tuple; missing values are left
+    # out together with their time step
+    results=[]
+    for t in tuples:
+        result=[]
+        steps=[]
+        for ts in timeSteps:
+            v = multi_get(data, (ts,)+t)
+            if v:
+                result.append(float(v))
+                steps.append(ts)
+        results.append((result, timeSteps if len(steps)==len(timeSteps) else steps))
+    return results
+
 def feature_from_dat(dat, name, observedPropertyName):
     dims = makedims(dat["dims"], dat["data"])
     timeSteps = getdimvals(dims, "time")
@@ -190,60 +401,52 @@ def feature_from_dat(dat, name, observedPropertyName):
     for d in dims:
         dim_name = list(d.keys())[0]
         if dim_name!="time":
-            dims_without_time.append(d)
+            dims_without_time.append(list(d.keys())[0])
             vals=getdimvals(dims, dim_name)
             valstack.append(vals)
     tuples = list(itertools.product(*valstack))
+    if len(tuples)==0:
+        return []
 
-    features=[]
-    for t in tuples:
-        print("T:", t)
-        result=[]
-        for ts in timeSteps:
-            v = multi_get(dat["data"], (ts,)+t)
-            if v:
-                result.append(float(v))
-
-        feature_dims={}
+    results = results_rowwise(dat["data"], timeSteps, tuples)
 
-        layer_name=dat["name"]
-        if dat["standard_name"]=="x_wind":
-            layer_name="x_"+dat["name"]
-        if dat["standard_name"]=="y_wind":
-            layer_name="y_"+dat["name"]
+    layer_name=dat["name"]
+    if dat["standard_name"]=="x_wind":
+        layer_name="x_"+dat["name"]
+    if dat["standard_name"]=="y_wind":
+        layer_name="y_"+dat["name"]
 
-        feature_id = "%s;%s;%s"%(observedPropertyName, dat["name"],dat["point"]["coords"])
-        i=0
-        for dim_value in t:
-            feature_dims[list(dims_without_time[i].keys())[0]]=dim_value
-            feature_id = feature_id + ";%s=%s"%(list(dims_without_time[i].keys())[0], dim_value)
-            i=i+1
+    lon, lat = dat["point"]["coords"].split(",")[0:2]
+    id_prefix = feature_ids.prefix(dat["name"], lon, lat)
+    id_suffix = feature_ids.suffix(timeSteps[0], timeSteps[-1])
+    lon = float(lon)
+    lat = float(lat)
 
-        feature_id = feature_id + ";%s$%s"%(timeSteps[0], timeSteps[-1])
+    features=[]
+    for t, (result, steps) in zip(tuples, results):
+        feature_dims=dict(zip(dims_without_time, t))
+        feature_id = id_prefix+feature_ids.dims_part(zip(dims_without_time, t))+id_suffix
         if len(feature_dims)==0:
             properties={
-                "timestep": timeSteps,
+                "timestep": steps,
                 "observationType": "MeasureTimeseriesObservation",
                 "observedPropertyName": name,
                 "result": result
             }
         else:
             properties={
-                "timestep": timeSteps,
+                "timestep": steps,
                 "dims": feature_dims,
                 "observationType": "MeasureTimeseriesObservation",
                 "observedPropertyName": name,
                 "result": result
             }
 
-        coords = dat["point"]["coords"].split(",")
-        coords[0]=float(coords[0])
-        coords[1]=float(coords[1])
         feature = {
                 "type": "Feature",
                 "geometry": {
                     "type": "Point",
-                    "coordinates":  coords
+                    "coordinates":  [lon, lat]
                 },
                 "properties": properties,
                 "id": feature_id
@@ -252,23 +455,20 @@ def feature_from_dat(dat, name, observedPropertyName):
     return features
 
 
-def request_(url, args, name, headers=None):
+def get_point(args):
+    if "lonlat" in args and args["lonlat"]:
+        return args["lonlat"].split(",")[0], args["lonlat"].split(",")[1]
+    if "latlon" in args and args["latlon"]:
+        return args["latlon"].split(",")[1], args["latlon"].split(",")[0]
+    return 5.2, 52.0
+
+def point_value_url(url, args):
     url = make_wms1_3(url)+"&request=getPointValue&INFO_FORMAT=application/json"
 
-    if "latlon" in args and args["latlon"]:
-        x=args["latlon"].split(",")[1]
-        y=args["latlon"].split(",")[0]
-        url = "%s&X=%s&Y=%s&CRS=EPSG:4326"%(url, x, y)
-    if "lonlat" in args and args["lonlat"]:
-        x=args["lonlat"].split(",")[0]
-        y=args["lonlat"].split(",")[1]
-        url = "%s&X=%s&Y=%s&CRS=EPSG:4326"%(url, x, y)
-    if not "CRS=" in url.upper():
-        url = "%s&X=%s&Y=%s&CRS=EPSG:4326"%(url, 5.2, 52.0)
-    reference_time = None
+    x, y = get_point(args)
+    url = "%s&X=%s&Y=%s&CRS=EPSG:4326"%(url, x, y)
     if "resultTime" in args and args["resultTime"]:
         url = "%s&DIM_REFERENCE_TIME=%s"%(url, args["resultTime"])
-        reference_time = args["resultTime"]
     if "datetime" in args and args["datetime"] is not None:
         url = "%s&TIME=%s"%(url, args["datetime"])
     else:
@@ -279,32 +479,162 @@ def request_(url, args, name, headers=None):
     if "dims" in args and args["dims"]:
         for dim in args["dims"].split(";"):
             dimname,dimval=dim.split(":")
-            print("DIM:", dimname, dimval)
+            log.debug("DIM: %s %s", dimname, dimval)
             if dimname.upper()=="ELEVATION":
                 url = "%s&%s=%s"%(url, dimname, dimval)
             else:
                 url = "%s&DIM_%s=%s"%(url, dimname, dimval)
+    return url
+
+def run_steps(steps, headers=None, timeout=TIMEOUT):
+    """Run a *_steps generator with blocking upstream calls.
 
-    print("URL:", url)
-    response = requests.get(url, headers=headers, timeout=TIMEOUT)
+    The generator yields (url, decode) for every upstream call it needs and
+    is sent decode(response), or the response itself when decode is None.
+    Concurrent identical calls share one upstream request and its decoded
+    result through upstream_flight. The asgi module runs the same
+    generators with non-blocking calls.
+    """
+    try:
+        url, decode = next(steps)
+        while True:
+            result = upstream_flight.do(upstream.normalize_url(url), lambda: fetch_upstream(url, decode, headers, timeout))
+            url, decode = steps.send(result)
+    except StopIteration as e:
+        return e.value
+
+def fetch_upstream(url, decode, headers=None, timeout=TIMEOUT):
+    with timed("upstream"):
+        response = upstream.get(url, headers=headers, timeout=timeout)
+    if decode is None:
+        return response
+    with timed("decode"):
+        return decode(response)
+
+def decode_point_values(response):
     if response.status_code == 200:
         try:
-            response_data = json.loads(response.content.decode('utf-8'), object_pairs_hook=OrderedDict)
+            response_data = serialization.loads(response.content)
         except ValueError:
+            from defusedxml.ElementTree import fromstring
             root = fromstring(response.content.decode('utf-8'))
-            print("ET:", root)
+            log.debug("ET: %s", root)
 
             retval =  json.dumps({"Error":  { "code": root[0].attrib["code"], "message": root[0].text}})
-            print("retval=", retval)
-            return 400, root[0].text.strip()
+            log.debug("retval= %s", retval)
+            return 400, root[0].text.strip(), 0
+        return 200, response_data, len(response.content)
+    # The WMS failed, unlike the exception report above this is not an
+    # answer about the point
+    return 502, "Upstream answered %d"%(response.status_code,), 0
+
+def fetch_point_values_steps(url, args):
+    url = point_value_url(url, args)
+    log.debug("URL: %s", url)
+    return (yield url, decode_point_values)
+
+def point_cache_key(url, args):
+    x, y = get_point(args)
+    dims=[]
+    if "dims" in args and args["dims"]:
+        for dim in args["dims"].split(";"):
+            dimname,dimval=dim.split(":")
+            dims.append("%s=%s"%(dimname.lower(), dimval))
+    return "|".join([
+        url,
+        args["observedPropertyName"],
+        # The exact point: the entries hold its coordinates and feature ids
+        "%s,%s"%(x, y),
+        args.get("resultTime") or "",
+        args.get("datetime") or "*",
+        ";".join(sorted(dims)),
+    ])
+
+def is_past_run(name, layer, reference_time, parameters=None):
+    # A model run that is not the latest one does not change anymore
+    if reference_time and reference_time!="*" and "," not in reference_time and "/" not in reference_time:
+        if parameters is None:
+            parameters = get_parameters(name)
+        latest = get_reference_times(parameters, layer, True)
+        if latest is not None and reference_time<latest:
+            return True
+    return False
+
+def point_cache_ttl(name, args):
+    # Called from the *_steps generators, which the asgi module runs on the
+    # event loop, so the capabilities are never loaded here: prepare_items()
+    # has just loaded them, and without them the result is not kept long
+    parameters = capabilities_cache.peek(name)
+    if parameters is not None and is_past_run(name, args["observedPropertyName"], args.get("resultTime"), parameters):
+        return POINT_CACHE_IMMUTABLE_TTL
+    return coll_by_name[name].get("point_cache_ttl", POINT_CACHE_TTL)
+
+def point_values_steps(url, batch, name):
+    """Decoded getPointValue entries for jobs that only differ in observedPropertyName.
+
+    Jobs are answered from point_cache where possible, the others with one
+    call with all their layers in LAYERS/QUERY_LAYERS. Returns (status, data)
+    per job, data being the list of entries for the job's layer.
+    """
+    results=[None]*len(batch)
+    keys=[point_cache_key(url, args) for args in batch]
+    missing=[]
+    for i, key in enumerate(keys):
+        data = point_cache.get(key)
+        if data is not None:
+            results[i]=(200, data)
+        else:
+            missing.append(i)
+
+    if len(missing)>1:
+        layer_names = [batch[i]["observedPropertyName"] for i in missing]
+        batch_args = {**batch[missing[0]]}
+        batch_args["observedPropertyName"] = ",".join(layer_names)
+        status, response_data, size = yield from fetch_point_values_steps(url, batch_args)
+        if status == 200:
+            data_by_layer={}
+            for data in response_data:
+                data_by_layer.setdefault(data["name"], []).append(data)
+            if set(data_by_layer.keys())==set(layer_names):
+                for i in missing:
+                    data = data_by_layer[batch[i]["observedPropertyName"]]
+                    point_cache.put(keys[i], data, size//len(missing), point_cache_ttl(name, batch[i]))
+                    results[i]=(200, data)
+                return results
+        # The WMS rejected the batch or its answer can not be split per layer
+        log.warning("Batch of %s failed, falling back to single calls", batch_args["observedPropertyName"])
+
+    for i in missing:
+        status, data, size = yield from fetch_point_values_steps(url, batch[i])
+        if status == 200:
+            point_cache.put(keys[i], data, size, point_cache_ttl(name, batch[i]))
+        results[i]=(status, data)
+    return results
+
+def request_batch_steps(url, batch, name):
+    """Features per job for jobs that only differ in observedPropertyName."""
+    results=[]
+    point_value_results = yield from point_values_steps(url, batch, name)
+    for args, (status, response_data) in zip(batch, point_value_results):
+        if status != 200:
+            results.append((status, response_data))
+            continue
         # print("RESP:", json.dumps(response_data, indent=2))
         features=[]
-        for data in response_data:
-            data_features = feature_from_dat(data, args["observedPropertyName"], name)
-            features.extend(data_features)
+        with timed("features"):
+            for data in response_data:
+                features.extend(feature_from_dat(data, args["observedPropertyName"], name))
+        results.append((200, features))
+    return results
+
+def request_batch(url, batch, name, headers=None, timeout=TIMEOUT):
+    return run_steps(request_batch_steps(url, batch, name), headers, timeout)
+
+def request_(url, args, name, headers=None, timeout=TIMEOUT):
+    return request_batch(url, [args], name, headers, timeout)[0]
 
-        return 200, features
-    return 400, "Error"
+def batch_key(url, args):
+    return point_value_url(url, {**args, "observedPropertyName": ""})
 
 def get_args(request):
     args={}
@@ -342,6 +672,16 @@ def get_args(request):
 
     return args, len(request_args)
 
+def pinned_dims(args):
+    pinned={}
+    if "dims" in args and args["dims"]:
+        for dim in args["dims"].split(";"):
+            dimname,dimval=dim.split(":")
+            pinned[dimname.lower()]=dimval
+    if "resultTime" in args and args["resultTime"]:
+        pinned["reference_time"]=args["resultTime"]
+    return pinned
+
 def make_link(pth, rel, typ, title):
     link = {
         "rel": rel,
@@ -379,27 +719,119 @@ def hello():
     root["links"].append(make_link("collections", "data", "application/json", "Metadata about the feature collections"))
 
     if "f" in request.args and request.args["f"]=="html":
-        response = render_template("root.html", root=root)
+        with timed("render"):
+            response = render_template("root.html", root=root)
+        return make_conditional(request, app.make_response(response), STATIC_MAX_AGE)
+    return make_conditional(request, app.make_response(root), STATIC_MAX_AGE)
+
+api_views.append(hello)
+
+def build_spec():
+    from schemas.schemas import create_apispec
+    settings = {}
+    if registry.servers is not None:
+        settings["servers"] = registry.servers
+    spec = create_apispec(
+            title="OGCAPI_F",
+            version="0.0.1",
+            openapi_version="3.0.2",
+            settings = settings
+            )
+    with app.test_request_context():
+        for view in api_views:
+            spec.path(view=view)
+    return spec
+
+def openapi_base():
+    """OpenAPI document of api_views, from OPENAPI_FILE unless schemas.py
+    or this file (the docstrings of the views) changed after it was
+    written, otherwise built once."""
+    if "base" not in openapi:
+        sources = [os.path.join(os.path.dirname(os.path.abspath(__file__)), "schemas", "schemas.py"), os.path.abspath(__file__)]
+        if os.path.exists(OPENAPI_FILE) and os.path.getmtime(OPENAPI_FILE)>=max(os.path.getmtime(s) for s in sources):
+            with open(OPENAPI_FILE, "rb") as f:
+                openapi["base"] = serialization.loads(f.read())
+        else:
+            if os.path.exists(OPENAPI_FILE):
+                log.warning("%s is older than the views or schemas, building the OpenAPI document", OPENAPI_FILE)
+            openapi["base"] = build_spec().to_dict()
+    return openapi["base"]
+
+def openapi_version():
+    # The servers of the registry, the collections and the layers of those
+    # with capabilities loaded, without loading any
+    version = []
+    for c in collections:
+        parameters = capabilities_cache.peek(c["name"]) or {"layers": []}
+        version.append((c["name"], tuple(l["name"] for l in parameters["layers"])))
+    return copy.deepcopy(registry.servers), tuple(version)
+
+def openapi_document(version):
+    """The base document with the servers of the registry, the collection
+    names as enum of {coll} and an items path per collection with its
+    layers as enum of observedPropertyName."""
+    servers, version = version
+    base = openapi_base()
+    document = {**base, "paths": dict(base["paths"])}
+    if servers is not None:
+        document["servers"] = servers
+    for path, operations in base["paths"].items():
+        if "{coll}" in path and "get" in operations:
+            operation = {**operations["get"]}
+            operation["parameters"] = [
+                {**p, "schema": {**p["schema"], "enum": [name for name, layers in version]}} if p["name"]=="coll" else p
+                for p in operation.get("parameters", [])]
+            document["paths"][path] = {**operations, "get": operation}
+    template = base["paths"].get("/collections/{coll}/items", {}).get("get")
+    if template is not None:
+        for name, layers in version:
+            operation = copy.deepcopy(template)
+            operation["parameters"] = [p for p in operation.get("parameters", []) if p["name"]!="coll"]
+            for p in operation["parameters"]:
+                if p["name"]=="observedPropertyName" and layers:
+                    p["schema"] = {"type": "array", "items": {"type": "string", "enum": list(layers)}}
+                    p["style"] = "form"
+                    p["explode"] = False
+            document["paths"]["/collections/%s/items"%(name,)] = {"get": operation}
+    return document
+
+def rendered_openapi():
+    """The OpenAPI document of the current version as JSON bytes and its
+    ETag, rendered once per version; the YAML is added on first use."""
+    version = openapi_version()
+    rendered = openapi.get("rendered")
+    if rendered is None or rendered["version"]!=version:
+        with timed("serialize"):
+            body = serialization.dumpb(openapi_document(version))
+        rendered = {"version": version, "json": body, "etag": make_etag(body)}
+        openapi["rendered"] = rendered
+    return rendered
+
+def openapi_response(representation, mimetype):
+    rendered = rendered_openapi()
+    etag = "%s-%s"%(rendered["etag"], representation)
+    response = not_modified(request, METADATA_MAX_AGE, etag)
+    if response is not None:
         return response
-    return root
-
-with app.test_request_context():
-    spec.path(view=hello)
+    if representation not in rendered:
+        import yaml
+        with timed("serialize"):
+            rendered["yaml"] = yaml.dump(serialization.loads(rendered["json"]), sort_keys=False).encode("utf-8")
+    return Response(rendered[representation], 200, mimetype=mimetype, headers=caching_headers(METADATA_MAX_AGE, etag))
 
 @app.route("/api", methods=['GET'])
 def api():
-    resp=app.make_response(spec.to_dict())
-    resp.mimetype="application/openapi; charset=utf-8; version=3.0"
-    return resp
+    return openapi_response("json", "application/openapi; charset=utf-8; version=3.0")
 
 @app.route("/api.yaml", methods=['GET'])
 def api_yaml():
-    resp=app.make_response(spec.to_yaml())
-    resp.mimetype="application/openapi+json; charset=utf-8; version=3.0"
-    return resp
+    return openapi_response("yaml", "application/openapi+yaml; charset=utf-8; version=3.0")
 
 
-def getcollection_by_name(coll):
+def build_collection(coll):
+    # Collection document with links relative to the root url, see getcollection_by_name
+    # Through capabilities_cache, so the first build uses the snapshot and
+    # later ones pick up the capabilities it reloads in the background
     collectiondata = coll_by_name[coll]
     params = get_parameters(collectiondata["name"])["layers"]
     param_s = ""
@@ -418,25 +850,25 @@ def getcollection_by_name(coll):
             "description": collectiondata["name"]+" with parameters: "+param_s,
             "links": [
                 {
-                    "href": request.root_url+"collections/%s"%(collectiondata["name"],),
+                    "href": "collections/%s"%(collectiondata["name"],),
                     "rel": "self",
                     "type": "application/json",
                     "title": "Metadata of "+collectiondata["title"]
                 },
                 {
-                    "href": request.root_url+"collections/%s?f=html"%(collectiondata["name"],),
+                    "href": "collections/%s?f=html"%(collectiondata["name"],),
                     "rel": "alternate",
                     "type": "text/html",
                     "title": "Metadata of "+collectiondata["title"]
                 },
                 {
-                    "href": request.root_url+"collections/%s/items?f=json"%(collectiondata["name"],),
+                    "href": "collections/%s/items?f=json"%(collectiondata["name"],),
                     "rel": "items",
                     "type": "application/geo+json",
                     "title": collectiondata["title"]
                 },
                 {
-                    "href": request.root_url+"collections/%s/items?f=html"%(collectiondata["name"],),
+                    "href": "collections/%s/items?f=html"%(collectiondata["name"],),
                     "rel": "items",
                     "type": "text/html",
                     "title": collectiondata["title"]+" (HTML)"
@@ -447,6 +879,11 @@ def getcollection_by_name(coll):
         }
     return c
 
+def getcollection_by_name(coll):
+    c = metadata.get(coll)
+    links = [{**l, "href": request.root_url+l["href"]} for l in c["links"]]
+    return {**c, "links": links}
+
 @app.route("/collections", methods=["GET"])
 def getcollections():
     """Collections endpoint.
@@ -485,13 +922,13 @@ def getcollections():
         res["collections"].append(getcollection_by_name(c["name"]))
 
     if "f" in request.args and request.args["f"]=="html":
-        response = render_template("collections.html", collections=res)
-        return response
+        with timed("render"):
+            response = render_template("collections.html", collections=res)
+        return make_conditional(request, app.make_response(response), METADATA_MAX_AGE)
 
-    return res
+    return make_conditional(request, app.make_response(res), METADATA_MAX_AGE)
 
-with app.test_request_context():
-    spec.path(view=getcollections)
+api_views.append(getcollections)
 
 @app.route("/collections/<coll>", methods=["GET"])
 def getcollection(coll):
@@ -508,13 +945,13 @@ def getcollection(coll):
     """
     collection = getcollection_by_name(coll)
     if "f" in request.args and request.args["f"]=="html":
-        response = render_template("collection.html", collection=collection)
-        return response
+        with timed("render"):
+            response = render_template("collection.html", collection=collection)
+        return make_conditional(request, app.make_response(response), METADATA_MAX_AGE)
 
-    return collection
+    return make_conditional(request, app.make_response(collection), METADATA_MAX_AGE)
 
-with app.test_request_context():
-    spec.path(view=getcollection)
+api_views.append(getcollection)
 
 def calculate_coords(bbox, nlon, nlat):
     dlon = (bbox[2]-bbox[0])/(nlon+1)
@@ -527,11 +964,14 @@ def calculate_coords(bbox, nlon, nlat):
             coords.append([lon, lat])
     return coords
 
-def get_coords(coords, next, limit):
-    if next>len(coords):
-        return None
-    else:
-        return coords[next:next+limit]
+def point_grid(coll_info, layer):
+    # Points are snapped to the centers of the cells of the model grid
+    # (configured as "grid" in the collection or from the capabilities)
+    if "grid" in coll_info:
+        return Grid.from_config(coll_info["grid"])
+    if layer is not None and "grid" in layer:
+        return Grid.from_list(layer["grid"])
+    return None
 
 def replaceNextToken(url, newNextToken):
     if "nextToken=" in url:
@@ -556,6 +996,35 @@ def get_reference_times(layers, layer, last=False):
 
     return None
 
+def items_format():
+    """Output format of an items request: "html", "covjson" or "json", from
+    f= or else the Accept header."""
+    f = request.args.get("f")
+    if f=="html":
+        return "html"
+    if f in ("covjson", "coveragejson"):
+        return "covjson"
+    if f is None and request.accept_mimetypes.best_match(["application/geo+json", "application/json", coveragejson.MEDIA_TYPE])==coveragejson.MEDIA_TYPE:
+        return "covjson"
+    return "json"
+
+def items_validators(coll, parameter_names, reference_times):
+    """ETag, Last-Modified and max-age for an items request.
+
+    Only responses of which every parameter is pinned to a model run get an
+    ETag: the run, the collection and the query determine their content.
+    """
+    if len(reference_times)==0 or any(t is None for t in reference_times):
+        return None, None, ITEMS_LIVE_MAX_AGE
+    etag = make_etag(coll, sorted(request.args.items(multi=True)), items_format(), parameter_names, reference_times)
+    run_times = [parse_time(t) for t in reference_times]
+    last_modified = None
+    if all(t is not None for t in run_times):
+        last_modified = max(run_times)
+    if all(is_past_run(coll, p, t) for p, t in zip(parameter_names, reference_times)):
+        return etag, last_modified, ITEMS_IMMUTABLE_MAX_AGE
+    return etag, last_modified, coll_by_name[coll].get("items_max_age", ITEMS_MAX_AGE)
+
 @app.route("/collections/<coll>/items", methods=["GET"])
 def getcollitems(coll):
     """Collection items endpoint.
@@ -569,6 +1038,8 @@ def getcollitems(coll):
               schema: LimitParameter
             - in: query
               schema: BboxParameter
+            - in: query
+              schema: BboxCrsParameter
             - in: query
               schema: DatetimeParameter
             - in: query
@@ -583,46 +1054,102 @@ def getcollitems(coll):
               schema: ObservedPropertyNameParameter
             - in: query
               schema: NPointsParameter
+            - in: query
+              schema: FormatParameter
         responses:
             200:
               description: returns items from a collection
               content:
                 application/json:
                   schema: FeatureCollectionGeoJSONSchema
+                application/prs.coverage+json:
+                  schema:
+                    type: object
+    """
+    query = prepare_items(coll)
+    if isinstance(query, Response):
+        return query
+
+    headers = {
+        'Content-Type': 'application/json'
+    }
+    deadline = time.monotonic()+REQUEST_DEADLINE
+    def fetch(batch):
+        return request_batch(query["coll_info"]["service"], [query["jobs"][i] for i in batch], coll, headers, remaining(deadline, TIMEOUT))
+    return items_response(query, fanout.imap(coll, fetch, query["batches"], deadline))
+
+def prepare_items(coll):
+    """Everything of an items request up to the upstream calls.
+
+    Returns a Response when the request is answered without going upstream
+    (bad arguments, 304), otherwise the planned query with the getPointValue
+    jobs and their batches for items_response().
     """
     coll_info = coll_by_name[coll]
 
     args, leftover_args = get_args(request)
-    if not "bbox" in args or args["bbox"] is None:
-        args["bbox"] = coll_info["extent"]
-    if not "npoints" in args or args["npoints"] is None:
-        args["npoints"] = 1
-    coords = calculate_coords(args["bbox"], args["npoints"], args["npoints"])
     if "crs" in args and args.get("crs") not in SUPPORTED_CRS:
         return Response("Unsupported CRS", 400)
     if "bbox-crs" in args and args.get("bbox-crs") not in SUPPORTED_CRS:
         return Response("Unsupported BBOX CRS", 400)
+    # Only the part of the bbox inside the collection has data
+    bbox = coll_info["extent"]
+    if args.get("bbox"):
+        try:
+            bbox = intersect(parse_bbox(args["bbox"], args.get("bbox-crs", CRS84)), coll_info["extent"])
+        except ValueError as e:
+            return Response("Invalid bbox: %s"%(e,), 400)
 
     limit = args["limit"]
     nextToken = args["nextToken"]
 
     if leftover_args>0:
         return Response("Too many arguments", 400)
+
+    # datetime and phenomenonTime both select the time steps
+    interval = None
+    if args.get("datetime") and args.get("phenomenonTime") and args["datetime"]!=args["phenomenonTime"]:
+        return Response("Use either datetime or phenomenonTime", 400)
+    time_arg = args.get("datetime") or args.get("phenomenonTime")
+    if time_arg:
+        try:
+            interval = parse_interval(time_arg)
+        except ValueError as e:
+            return Response("Invalid datetime: %s"%(e,), 400)
+    args.pop("phenomenonTime", None)
+
     params = get_parameters(coll)
-    headers = {
-        'Content-Type': 'application/json'
-    }
 
-    request_path = request.full_path
-    features=[]
     if "observedPropertyName" not in args or args["observedPropertyName"] is None:
-        args["observedPropertyName"]=[params["layers"][0]["name"]]
-    print("OBS:", args["observedPropertyName"])
+        args["observedPropertyName"]=coll_info.get("default_parameters", [params["layers"][0]["name"]])
+    log.debug("OBS: %s", args["observedPropertyName"])
 
     layers=[]
     if not "resultTime" in args:
-        layers = get_parameters(coll)
-
+        layers = params
+
+    layer_by_name={}
+    for l in params["layers"]:
+        layer_by_name[l["name"]]=l
+
+    # A bbox without npoints is sampled at the model resolution, from the
+    # grid of the first parameter or BBOX_SAMPLE_RESOLUTION degrees, with
+    # at most BBOX_MAX_POINTS points
+    if bbox is None:
+        coords = []
+    elif args.get("npoints") or not args.get("bbox"):
+        npoints = args.get("npoints") or 1
+        coords = calculate_coords(bbox, npoints, npoints)
+    else:
+        grid = point_grid(coll_info, layer_by_name.get(args["observedPropertyName"][0]))
+        if grid is None:
+            grid = Grid(bbox[0], bbox[1], bbox[2], bbox[3], BBOX_SAMPLE_RESOLUTION, BBOX_SAMPLE_RESOLUTION)
+        coords = grid.centers(bbox, BBOX_MAX_POINTS)
+
+    jobs=[]
+    counts=[]
+    points=[]
+    reference_times=[]
     for parameter_name in args["observedPropertyName"]:
         param_args = {**args}
         param_args["observedPropertyName"]=parameter_name
@@ -630,50 +1157,233 @@ def getcollitems(coll):
             latest_reference_time = get_reference_times(layers, parameter_name, True)
             if latest_reference_time:
                 param_args["resultTime"]=latest_reference_time
+        reference_times.append(param_args.get("resultTime"))
+        if interval is not None:
+            # Only send the requested time steps upstream; the time extent
+            # in the capabilities is the one of the latest model run
+            extent = None
+            layer = layer_by_name.get(parameter_name)
+            if layer is not None and "time" in layer and param_args.get("resultTime")==get_reference_times(params, parameter_name, True):
+                extent = [parse_datetime(t) for t in layer["time"]]
+            param_args["datetime"] = time_parameter(interval, extent)
+            if param_args["datetime"] is None:
+                # Nothing of this parameter in the requested interval
+                continue
+        count = features_per_point(layer_by_name.get(parameter_name), pinned_dims(param_args))
+        grid = point_grid(coll_info, layer_by_name.get(parameter_name))
         if "lonlat" in param_args or "latlon" in param_args:
-            print("single")
-            status, coordfeatures = request_(coll_info["service"], param_args, coll_info["name"], headers)
-            features.extend(coordfeatures)
+            if grid is None:
+                jobs.append(param_args)
+                counts.append(count)
+                points.append(None)
+                continue
+            x, y = get_point(param_args)
+            param_coords = [[float(x), float(y)]]
+            param_args.pop("latlon", None)
         else:
-            for c in coords: #get_coords(coords, int(args["nextToken"]), int(args["limit"])):
-                param_args["lonlat"] = "%f,%f"%(c[0], c[1])
-                status, coordfeatures = request_(coll_info["service"], param_args, coll_info["name"], headers)
-                features.extend(coordfeatures)
+            param_coords = coords
+        for c in param_coords:
+            coord_args = {**param_args}
+            if grid is None:
+                coord_args["lonlat"] = "%f,%f"%(c[0], c[1])
+                points.append(None)
+            else:
+                coord_args["lonlat"] = "%f,%f"%grid.snap(c[0], c[1])
+                points.append(c)
+            jobs.append(coord_args)
+            counts.append(count)
+
+    # The model runs are known now, so a client that has this page can be
+    # answered without going upstream
+    etag, last_modified, max_age = items_validators(coll, args["observedPropertyName"], reference_times)
+    response = not_modified(request, max_age, etag, last_modified)
+    if response is not None:
+        return response
 
-    if "f" in request.args and request.args["f"]=="html":
+    # Only fetch the (parameter, coordinate) pairs that end up in this page
+    page = plan_page(counts, nextToken, limit)
+
+    # Points snapped to the same grid cell are fetched once: sources maps
+    # every job to the first identical job
+    sources={}
+    first_job={}
+    fetch_jobs=[]
+    for i in page.jobs:
+        key = point_value_url(coll_info["service"], jobs[i])
+        if key not in first_job:
+            first_job[key]=i
+            fetch_jobs.append(i)
+        sources[i]=first_job[key]
+
+    # Jobs for the same point and dimensions share one upstream call
+    max_batch_layers = coll_info.get("max_batch_layers", MAX_BATCH_LAYERS)
+    batches=[]
+    open_batches={}
+    for i in fetch_jobs:
+        key = batch_key(coll_info["service"], jobs[i])
+        if key not in open_batches or len(open_batches[key])>=max_batch_layers:
+            open_batches[key]=[]
+            batches.append(open_batches[key])
+        open_batches[key].append(i)
+
+    return {
+        "coll_info": coll_info,
+        "jobs": jobs,
+        "points": points,
+        "sources": sources,
+        "page": page,
+        "batches": batches,
+        "etag": etag,
+        "last_modified": last_modified,
+        "max_age": max_age,
+    }
+
+class UpstreamFailed(Exception):
+    """An upstream call of an items page failed."""
+
+def items_response(query, batch_results):
+    """Response for a query of prepare_items(), batch_results being the
+    request_batch() results of its batches, in order (may be lazy)."""
+    coll_info = query["coll_info"]
+    page = query["page"]
+    batches = query["batches"]
+    sources = query["sources"]
+    points = query["points"]
+    etag, last_modified, max_age = query["etag"], query["last_modified"], query["max_age"]
+    limit = page.limit
+    nextToken = page.start
+    request_path = request.full_path
+
+    def job_features():
+        # Features of every planned job in job order, as soon as its batch is in
+        batch_iter = iter(batch_results)
+        batch_of={}
+        for b, batch in enumerate(batches):
+            for i in batch:
+                batch_of[i]=b
+        results={}
+        done=0
+        for i in page.jobs:
+            source = sources[i]
+            while batch_of[source]>=done:
+                for j, result in zip(batches[done], next(batch_iter)):
+                    results[j]=result
+                done+=1
+            status, coordfeatures = results[source]
+            if status>=500:
+                # Leaving its features out would give an incomplete page
+                # that is cached as the complete one
+                raise UpstreamFailed(coordfeatures)
+            if status!=200:
+                yield []
+                continue
+            if points[i] is not None:
+                # Data of the grid cell, located at the requested point. The
+                # id holds that point too, so points in the same cell keep
+                # their own features
+                lon, lat = points[i]
+                geometry = {"type": "Point", "coordinates": points[i]}
+                coordfeatures = [{**f, "id": feature_ids.with_point(f["id"], str(lon), str(lat)), "geometry": geometry}
+                                 for f in coordfeatures]
+            remember_items(coll_info["name"], coordfeatures)
+            yield coordfeatures
+
+    output_format = items_format()
+    if output_format=="html":
         links=[
             make_link(request_path, "self", "text/html", "This document"),
             make_link(replaceFormat(request_path, "json"), "alternate", "application/geo+json", "This document"),
+            make_link(replaceFormat(request_path, "covjson"), "alternate", coveragejson.MEDIA_TYPE, "This document as CoverageJSON"),
+        ]
+        mime_type = "text/html"
+    elif output_format=="covjson":
+        links=[
+            make_link(request_path, "self", coveragejson.MEDIA_TYPE, "This document"),
+            make_link(replaceFormat(request_path, "json"), "alternate", "application/geo+json", "This document"),
+            make_link(replaceFormat(request_path, "html"), "alternate", "text/html", "This document"),
         ]
+        mime_type = coveragejson.MEDIA_TYPE
     else:
         links=[
             make_link(request_path, "self", "application/geo+json", "This document"),
             make_link(replaceFormat(request_path, "html"), "alternate", "text/html", "This document"),
+            make_link(replaceFormat(request_path, "covjson"), "alternate", coveragejson.MEDIA_TYPE, "This document as CoverageJSON"),
         ]
-
-    response_features = features[nextToken:nextToken+limit]
-    if len(features)>limit and len(features)>(nextToken+limit):
-        new_path = replaceNextToken(request.full_path, str(nextToken+limit))
-        links.append(make_link(new_path, "next", "application/geo+json", "Next set of elements"))
+        mime_type = "application/geo+json"
+    next_link = make_link(replaceNextToken(request.full_path, str(nextToken+limit)), "next", mime_type, "Next set of elements")
+
+    headers = {'Content-Crs': "<http://www.opengis.net/def/crs/OGC/1.3/CRS84>", "Vary": "Accept"}
+    headers.update(caching_headers(max_age, etag, last_modified))
+
+    if STREAM_ITEMS and output_format=="json":
+        # Send the envelope right away and every feature as soon as its
+        # upstream call is in; links and counts follow at the end
+        def generate():
+            yield b'{"type":"FeatureCollection","features":['
+            returned=0
+            try:
+                for feature in page.iter_page(job_features()):
+                    yield (b"," if returned else b"")+serialization.dumpb(feature)
+                    returned+=1
+            except (DeadlineExceeded, requests.exceptions.Timeout):
+                # The status is already sent, end with an incomplete document
+                log.warning("Upstream request deadline exceeded while streaming %s", request_path)
+                return
+            except UpstreamFailed as e:
+                log.warning("Upstream request failed while streaming %s: %s", request_path, e)
+                return
+            if page.has_more():
+                links.append(next_link)
+            tail = {
+                "timeStamp": datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "numberReturned": returned,
+                "numberMatched": page.total,
+                "links": links
+            }
+            if page.total is None:
+                del tail["numberMatched"]
+            yield b"],"+serialization.dumpb(tail)[1:]
+        return Response(stream_with_context(generate()), 200, mimetype=mime_type, headers=headers)
+
+    try:
+        response_features = page.page(job_features())
+    except (DeadlineExceeded, requests.exceptions.Timeout):
+        return Response("Upstream request deadline exceeded", 504)
+    except UpstreamFailed:
+        return Response("Upstream request failed", 502)
+    if page.has_more():
+        links.append(next_link)
 
     featurecollection = {
             "type": "FeatureCollection",
             "features": response_features,
             "timeStamp": datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ"),
             "numberReturned": len(response_features),
-            "numberMatched": len(features),
+            "numberMatched": page.total,
             "links": links
     }
-
-    mime_type = "application/geo+json"
-    headers = {'Content-Crs': "<http://www.opengis.net/def/crs/OGC/1.3/CRS84>"}
-    if "f" in request.args and request.args["f"]=="html":
-        response = render_template("items.html", collection=coll_info["name"], items=featurecollection)
-        return response
-    return Response(json.dumps(featurecollection), 200, mimetype=mime_type, headers=headers)
-
-with app.test_request_context():
-    spec.path(view=getcollitems)
+    if page.total is None:
+        # Not all counts are known without fetching the whole grid
+        del featurecollection["numberMatched"]
+
+    if output_format=="html":
+        with timed("render"):
+            response = render_template("items.html", collection=coll_info["name"], items=featurecollection)
+        return Response(response, 200, mimetype="text/html", headers=caching_headers(max_age, etag, last_modified))
+    if output_format=="covjson":
+        # The time axis once per parameter, the results as one array
+        with timed("serialize"):
+            coverages = coveragejson.coverage_collection(response_features)
+            for k in ("timeStamp", "numberReturned", "numberMatched", "links"):
+                if k in featurecollection:
+                    coverages[k] = featurecollection[k]
+            body = serialization.dumpb(coverages)
+        return Response(body, 200, mimetype=mime_type, headers=headers)
+    with timed("serialize"):
+        body = serialization.dumpb(featurecollection)
+    return Response(body, 200, mimetype=mime_type, headers=headers)
+
+api_views.append(getcollitems)
 
 @app.route("/collections/<coll>/items/<featureid>", methods=["GET"])
 def getcollitembyid(coll, featureid):
@@ -688,19 +1398,72 @@ def getcollitembyid(coll, featureid):
                 application/geo+json:
                   schema: FeatureGeoJSONSchema
     """
-    print("REQUESTING FEATURE", featureid, "of", coll)
+    log.debug("REQUESTING FEATURE %s of %s", featureid, coll)
 
-    params = get_parameters(coll)
     headers = {
         'Content-Type': 'application/geo+json',
     }
 
+    query = prepare_item(coll, featureid)
+    if isinstance(query, Response):
+        return query
+    result = stored_item(query)
+    if result is None:
+        coll_info = query["coll_info"]
+        result = request_by_id(coll_info["service"], coll_info["name"], headers, query["item"])
+    return item_response(query, result)
+
+def prepare_item(coll, featureid):
     coll_info = coll_by_name[coll]
-    (status, feature, headers) =  request_by_id(coll_info["service"], coll_info["name"], headers, featureid)
+    try:
+        item = feature_ids.decode(featureid)
+    except ValueError:
+        return Response("Feature %s not found"%(featureid,), 404)
+
+    # The id holds the requested point; like prepare_items() the upstream
+    # is asked for the center of its grid cell
+    layer = None
+    if "grid" not in coll_info:
+        layer = next((l for l in get_parameters(coll)["layers"] if l["name"]==item["layer"]), None)
+    grid = point_grid(coll_info, layer)
+    if grid is not None:
+        try:
+            x, y = grid.snap(float(item["lon"]), float(item["lat"]))
+        except ValueError:
+            return Response("Feature %s not found"%(featureid,), 404)
+        item["x"], item["y"] = "%f"%x, "%f"%y
+
+    # An id with a model run and time range always describes the same data
+    etag = None
+    last_modified = None
+    max_age = ITEMS_LIVE_MAX_AGE
+    for dim_name, dim_value in item["dims"]:
+        if dim_name.lower()=="reference_time":
+            reference_time = dim_value
+            etag = make_etag(coll, featureid)
+            last_modified = parse_time(reference_time)
+            if is_past_run(coll, item["layer"], reference_time):
+                max_age = ITEMS_IMMUTABLE_MAX_AGE
+            else:
+                max_age = coll_info.get("items_max_age", ITEMS_MAX_AGE)
+    response = not_modified(request, max_age, etag, last_modified)
+    if response is not None:
+        return response
+    return {
+        "coll_info": coll_info,
+        "featureid": featureid,
+        "item": item,
+        "etag": etag,
+        "last_modified": last_modified,
+        "max_age": max_age,
+    }
+
+def item_response(query, result):
+    (status, feature, headers) = result[0:3]
+    if status==200:
+        headers.update(caching_headers(query["max_age"], query["etag"], query["last_modified"]))
     return Response(feature, status, headers=headers)
 
-with app.test_request_context():
-    spec.path(view=getcollitems)
 
 @app.route("/conformance", methods=["GET"])
 def getconformance():
@@ -725,13 +1488,13 @@ def getconformance():
         ]
     }
     if "f" in request.args and request.args["f"]=="html":
-        response = render_template("conformance.html", title="Conformance", description="conforms to:", conformance=conformance)
-        return response
+        with timed("render"):
+            response = render_template("conformance.html", title="Conformance", description="conforms to:", conformance=conformance)
+        return make_conditional(request, app.make_response(response), STATIC_MAX_AGE)
 
-    return conformance
+    return make_conditional(request, app.make_response(conformance), STATIC_MAX_AGE)
 
-with app.test_request_context():
-    spec.path(view=getconformance)
+api_views.append(getconformance)
 
 
 def make_wms1_3(serv):
@@ -745,10 +1508,14 @@ def get_dimensions(l, skip_dims=[]):
             dims.append(dim)
     return dims
 
-@app.route("/getparams/<collname>", methods=['GET'])
-def get_parameters(collname):
+def load_parameters(collname):
     coll=coll_by_name[collname]
-    wms = WebMapService(coll["service"], version='1.3.0')
+    from owslib.wms import WebMapService
+    with timed("capabilities", collname):
+        response = upstream.get(make_wms1_3(coll["service"])+"&request=GetCapabilities", timeout=TIMEOUT)
+        response.raise_for_status()
+        wms = WebMapService(coll["service"], version='1.3.0', xml=response.content)
+        grids = grids_from_capabilities(response.content)
     layers=[]
     for l in wms.contents:
         ls = l
@@ -757,12 +1524,130 @@ def get_parameters(collname):
           layer = { "name": ls, "dims": dims}
         else:
           layer = { "name": ls}
+        # First and last time step of the default (latest) model run
+        extent = time_extent(wms[l].timepositions)
+        if extent is not None:
+            layer["time"] = [format_datetime(t) for t in extent]
+        # Native lon/lat grid, for snapping points to grid cells
+        if ls in grids:
+            layer["grid"] = grids[ls].to_list()
         layers.append(layer)
 
     layers.sort(key=lambda l: l["name"])
     return { "layers": layers }
 
-WSGIRequestHandler.protocol_version = "HTTP/1.1"
+point_cache = ResponseCache(max_bytes=POINT_CACHE_BYTES, directory=POINT_CACHE_DIR)
+
+# Features served in items responses by collection and id
+item_store = ResponseCache(max_bytes=ITEM_STORE_BYTES)
+
+# Compressed response bodies by path, ETag and encoding
+compressed_cache = ResponseCache(max_bytes=COMPRESSED_CACHE_BYTES)
+
+# Identical upstream calls in flight at the same time share one request
+upstream_flight = SingleFlight()
+
+# Collection documents, rebuilt every METADATA_REFRESH_INTERVAL seconds
+metadata = MetadataRegistry([c["name"] for c in collections], build_collection, METADATA_REFRESH_INTERVAL)
+
+def poll_runs(name):
+    """Latest reference_time per layer of a collection, from fresh capabilities."""
+    parameters = load_parameters(name)
+    capabilities_cache.put(name, parameters)
+    runs={}
+    for layer in parameters["layers"]:
+        reference_time = get_reference_times(parameters, layer["name"], True)
+        if reference_time:
+            runs[layer["name"]]=reference_time
+    return runs
+
+def warm_runs(name, runs):
+    """Fetch the configured points of the new runs into point_cache, with
+    the same job arguments as prepare_items() so requests hit the cache."""
+    coll_info = coll_by_name[name]
+    config = coll_info.get("prefetch", {})
+    parameters = config.get("parameters")
+    coords = [list(c) for c in config.get("points", PREFETCH_POINTS)]
+    for n in config.get("npoints", PREFETCH_NPOINTS):
+        coords.extend(calculate_coords(coll_info["extent"], n, n))
+    layer_by_name={}
+    for l in get_parameters(name)["layers"]:
+        layer_by_name[l["name"]]=l
+
+    jobs=[]
+    for parameter_name, reference_time in runs.items():
+        if parameters is not None and parameter_name not in parameters:
+            continue
+        grid = point_grid(coll_info, layer_by_name.get(parameter_name))
+        for c in coords:
+            if grid is not None:
+                c = grid.snap(c[0], c[1])
+            jobs.append({
+                "observedPropertyName": parameter_name,
+                "resultTime": reference_time,
+                "lonlat": "%f,%f"%(c[0], c[1]),
+            })
+
+    max_batch_layers = coll_info.get("max_batch_layers", MAX_BATCH_LAYERS)
+    batches=[]
+    open_batches={}
+    for args in jobs:
+        key = batch_key(coll_info["service"], args)
+        if key not in open_batches or len(open_batches[key])>=max_batch_layers:
+            open_batches[key]=[]
+            batches.append(open_batches[key])
+        open_batches[key].append(args)
+    log.info("Prefetching %d points of %s for runs %s", len(jobs), name, runs)
+    for batch in batches:
+        prefetch_limiter.wait()
+        request_batch(coll_info["service"], batch, name)
+
+# New model runs are fetched for the hot points before clients ask for them
+prefetch_limiter = RateLimiter(PREFETCH_RATE)
+prefetcher = Prefetcher([c["name"] for c in collections], poll_runs, warm_runs, PREFETCH_INTERVAL)
+
+def collections_changed(added, removed, changed):
+    # Only what is derived from the configuration of the collections that
+    # changed is rebuilt
+    for name in removed+changed:
+        capabilities_cache.invalidate(name)
+        metadata.discard(name)
+    for name in added+changed:
+        c = coll_by_name[name]
+        fanout.set_limit(name, c.get("max_concurrency", UPSTREAM_CONCURRENCY))
+        capabilities_cache.set_ttl(name, c.get("capabilities_ttl"))
+    names = [c["name"] for c in collections]
+    metadata.names = names
+    prefetcher.names = names
+    openapi.pop("rendered", None)
+
+registry.listen(collections_changed)
+
+def cache_metrics():
+    flight = upstream_flight.stats()
+    return [
+        ("ogcapi_point_cache_hits_total", "counter", "getPointValue results served from the cache", {}, point_cache.hits),
+        ("ogcapi_point_cache_misses_total", "counter", "getPointValue results not in the cache", {}, point_cache.misses),
+        ("ogcapi_point_cache_bytes", "gauge", "Size of the getPointValue cache", {}, point_cache.bytes),
+        ("ogcapi_item_store_hits_total", "counter", "Features by id served from the item store", {}, item_store.hits),
+        ("ogcapi_item_store_misses_total", "counter", "Features by id not in the item store", {}, item_store.misses),
+        ("ogcapi_upstream_calls_total", "counter", "Upstream calls made", {"mode": "wsgi"}, flight["misses"]),
+        ("ogcapi_upstream_coalesced_total", "counter", "Upstream calls shared with an identical call in flight", {"mode": "wsgi"}, flight["hits"]),
+        ("ogcapi_upstream_waiters", "gauge", "Callers waiting for an identical call in flight", {"mode": "wsgi"}, flight["waiters"]),
+    ]
+
+metrics.register(cache_metrics)
+
+@app.route("/metrics", methods=["GET"])
+def getmetrics():
+    return Response(metrics.render(), 200, mimetype="text/plain; version=0.0.4")
+
+@app.route("/getparams/<collname>", methods=['GET'])
+def get_parameters(collname):
+    return capabilities_cache.get(collname, load_parameters)
 
 if __name__ == "__main__":
+    # Only the development server needs werkzeug.serving
+    from werkzeug.serving import WSGIRequestHandler
+    WSGIRequestHandler.protocol_version = "HTTP/1.1"
     app.run(host='0.0.0.0', port=5001)
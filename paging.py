@@ -0,0 +1,110 @@
+def count_values(value, values):
+    """Number of dimension values selected by a WMS dimension value."""
+    if value == "*":
+        return len(values)
+    return len(value.split(","))
+
+
+def features_per_point(layer, pinned):
+    """Expected number of features one getPointValue call for layer returns.
+
+    layer is an entry of get_parameters()["layers"] and pinned maps lower case
+    dimension names to the values that are sent upstream. Dimensions that are
+    not sent resolve to their default value on the WMS and give one feature.
+    Returns None when the layer is not known from the capabilities.
+    """
+    if layer is None:
+        return None
+    n = 1
+    for d in layer.get("dims", []):
+        value = pinned.get(d["name"].lower())
+        if value is not None:
+            n = n*count_values(value, d["values"])
+    return n
+
+
+class Page:
+    """Upstream jobs needed for one page of features.
+
+    jobs are the indices of the jobs to fetch, offset is the index of the
+    first feature the first fetched job produces.
+    """
+    def __init__(self, jobs, offset, start, limit, counts, complete):
+        self.jobs = jobs
+        self.offset = offset
+        self.start = start
+        self.limit = limit
+        self.counts = counts
+        self.complete = complete
+        self.total = None
+        if all(c is not None for c in counts):
+            self.total = sum(counts)
+
+    def page(self, results):
+        """Features of the requested window from the results of self.jobs, in job order."""
+        return list(self.iter_page(results))
+
+    def iter_page(self, results):
+        """Like page(), yielding the features as the results come in."""
+        begin = self.start-self.offset
+        end = begin+self.limit
+        position = 0
+        self._returned = 0
+        for job, job_features in zip(self.jobs, results):
+            if self.counts[job] is not None and len(job_features) != self.counts[job]:
+                # The WMS returned something else than the capabilities
+                # promised, the total can not be trusted anymore
+                self.total = None
+            for feature in job_features:
+                if begin <= position < end:
+                    self._returned += 1
+                    yield feature
+                position += 1
+        self._fetched = position
+
+    def has_more(self):
+        if not self._returned:
+            # Nothing in this window (failed or short calls): a next window
+            # would be a guess
+            return False
+        if self.total is not None:
+            return self.total > self.start+self.limit
+        return not self.complete or self._fetched > self.start-self.offset+self.limit
+
+
+def plan_page(counts, start, limit):
+    """Work out which jobs produce the features start..start+limit.
+
+    counts holds the expected number of features for every job, in feature
+    order, or None where it is unknown. Jobs that end before the window are
+    skipped as long as all counts before them are known; after an unknown
+    count every job is fetched until at least one feature per job would
+    fill the window.
+    """
+    end = start+limit
+    jobs = []
+    offset = None
+    position = 0
+    exact = True
+    i = 0
+    for i, count in enumerate(counts):
+        if position >= end:
+            break
+        if count is None:
+            exact = False
+            lower = 1
+        else:
+            lower = count
+        if exact and position+lower <= start:
+            position += lower
+            continue
+        if offset is None:
+            offset = position
+        jobs.append(i)
+        position += lower
+    else:
+        i = len(counts)
+
+    if offset is None:
+        offset = position
+    return Page(jobs, offset, start, limit, counts, i >= len(counts))
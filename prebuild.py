@@ -0,0 +1,45 @@
+"""Build time artifacts for a faster cold start (Zappa/Lambda).
+
+    python prebuild.py [--capabilities]
+
+Writes the OpenAPI document to OPENAPI_FILE, so the deployed app serves it
+without importing apispec and marshmallow, and with --capabilities the
+GetCapabilities results of all collections to CAPABILITIES_SNAPSHOT, which
+the app serves until its first refresh. Run it before `zappa update`; both
+files are picked up from next to ogcapi_f.py.
+"""
+import argparse
+import os
+import sys
+
+# The artifacts are written, so they must not be read
+os.environ["OPENAPI_FILE"] = ""
+os.environ["CAPABILITIES_SNAPSHOT"] = ""
+
+import ogcapi_f
+import serialization
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def write(path, document):
+    with open(path+".tmp", "wb") as f:
+        f.write(serialization.dumpb(document))
+    os.replace(path+".tmp", path)
+    print("Wrote %s"%(path,), file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prebuild the OpenAPI document and a capabilities snapshot")
+    parser.add_argument("--openapi", default=os.path.join(HERE, "openapi.json"))
+    parser.add_argument("--capabilities", nargs="?", const=os.path.join(HERE, "capabilities.json"),
+                        help="also write the capabilities of all collections (to this file)")
+    a = parser.parse_args()
+
+    write(a.openapi, ogcapi_f.build_spec().to_dict())
+    if a.capabilities:
+        write(a.capabilities, dict((c["name"], ogcapi_f.load_parameters(c["name"])) for c in ogcapi_f.collections))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import logging
+import threading
+import time
+
+log = logging.getLogger("ogcapi_f")
+
+
+class RateLimiter:
+    """Blocks callers so that at most rate calls per second pass."""
+    def __init__(self, rate):
+        self.interval = 1.0/rate if rate > 0 else 0
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next-now
+            self._next = max(now, self._next)+self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+class Prefetcher:
+    """Polls for new model runs and warms the caches for them.
+
+    poll(name) returns {layer: latest reference_time} of a collection,
+    warm(name, runs) is called with the layers that got a new run since
+    the previous poll (all layers on the first one). A daemon thread polls
+    every interval seconds.
+    """
+    def __init__(self, names, poll, warm, interval=300):
+        self.names = list(names)
+        self.poll = poll
+        self.warm = warm
+        self.interval = interval
+        self._seen = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def check(self):
+        """Poll all collections once and warm the new runs."""
+        for name in self.names:
+            try:
+                runs = self.poll(name)
+            except Exception:
+                log.exception("Polling %s for new runs failed", name)
+                continue
+            new_runs = {}
+            for layer, reference_time in runs.items():
+                if self._seen.get((name, layer)) != reference_time:
+                    new_runs[layer] = reference_time
+            if not new_runs:
+                continue
+            try:
+                self.warm(name, new_runs)
+            except Exception:
+                # Try again on the next poll
+                log.exception("Prefetching %s failed", name)
+                continue
+            for layer, reference_time in new_runs.items():
+                self._seen[(name, layer)] = reference_time
+
+    def start(self):
+        if self._thread is not None or self.interval <= 0:
+            return
+
+        def run():
+            while True:
+                self.check()
+                time.sleep(self.interval)
+
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=run, name="prefetch", daemon=True)
+                self._thread.start()
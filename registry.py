@@ -0,0 +1,106 @@
+import json
+import logging
+import os
+import threading
+import time
+
+log = logging.getLogger("ogcapi_f")
+
+REQUIRED = ["name", "service", "extent"]
+
+
+def parse_config(document):
+    """(collections, servers) of a config document: a list of collections,
+    or a mapping with "collections" and optionally "servers".
+
+    Raises ValueError when a collection misses a required key or has an
+    invalid extent.
+    """
+    servers = None
+    if isinstance(document, dict):
+        servers = document.get("servers")
+        document = document.get("collections")
+    if not isinstance(document, list):
+        raise ValueError("no list of collections")
+    collections = []
+    names = set()
+    for c in document:
+        missing = [k for k in REQUIRED if k not in c]
+        if missing:
+            raise ValueError("collection %s misses %s"%(c.get("name", len(collections)), ", ".join(missing)))
+        if c["name"] in names:
+            raise ValueError("collection %s is defined twice"%(c["name"],))
+        extent = [float(v) for v in c["extent"]]
+        if len(extent) != 4 or extent[0] > extent[2] or extent[1] > extent[3]:
+            raise ValueError("collection %s has an invalid extent"%(c["name"],))
+        names.add(c["name"])
+        collections.append({"title": c["name"], "url": "/"+c["name"], **c, "extent": extent})
+    return collections, servers
+
+
+class CollectionRegistry:
+    """Collections from a YAML (or JSON) file, reloaded when it changes.
+
+    collections and by_name are updated in place, so modules can keep a
+    reference to them. check() looks at the modification time of the file
+    at most every interval seconds and reloads it when it changed; a file
+    that does not parse keeps the current collections. Listeners get the
+    names of the added, removed and changed collections after every change.
+    """
+    def __init__(self, path, interval=5):
+        self.path = path
+        self.interval = interval
+        self.collections = []
+        self.by_name = {}
+        self.servers = None
+        self._listeners = []
+        self._mtime = None
+        self._checked = 0
+        self._lock = threading.Lock()
+
+    def listen(self, listener):
+        self._listeners.append(listener)
+
+    def load(self):
+        mtime = os.stat(self.path).st_mtime
+        with open(self.path) as f:
+            if self.path.endswith(".json"):
+                document = json.load(f)
+            else:
+                # Not needed for a JSON config, which starts faster
+                import yaml
+                document = yaml.safe_load(f)
+        collections, servers = parse_config(document)
+        self._mtime = mtime
+        self.replace(collections, servers)
+
+    def check(self):
+        now = time.monotonic()
+        if self.interval <= 0 or now-self._checked < self.interval:
+            return
+        with self._lock:
+            if now-self._checked < self.interval:
+                return
+            self._checked = now
+            try:
+                if os.stat(self.path).st_mtime == self._mtime:
+                    return
+                self.load()
+            except Exception as e:
+                log.warning("Reloading collections from %s failed: %s", self.path, e)
+
+    def replace(self, collections, servers=None):
+        old = dict(self.by_name)
+        new = dict((c["name"], c) for c in collections)
+        added = [name for name in new if name not in old]
+        removed = [name for name in old if name not in new]
+        changed = [name for name in new if name in old and new[name] != old[name]]
+        # New entries first, so a name that stays is never missing
+        self.by_name.update(new)
+        self.collections[:] = collections
+        for name in removed:
+            del self.by_name[name]
+        if servers is not None:
+            self.servers = servers
+        for listener in self._listeners:
+            listener(added, removed, changed)
@@ -111,6 +111,12 @@ class LimitParameter(Schema):
 class BboxParameter(Schema):
     bbox = fields.List(fields.Number(), validate=Length(min=4, max=6), metadata={"explode": False, "style": "form"})
 
+class BboxCrsParameter(Schema):
+    bbox_crs = fields.Str(data_key="bbox-crs", validate=OneOf([
+        "http://www.opengis.net/def/crs/OGC/1.3/CRS84",
+        "http://www.opengis.net/def/crs/EPSG/0/4326",
+        ]), metadata={"style": "form"})
+
 class DatetimeParameter(Schema):
     datetime = fields.Str(metadata={"style": "form"})
 
@@ -132,6 +138,9 @@ class NPointsParameter(Schema):
 class ObservedPropertyNameParameter(Schema):
       observedPropertyName = fields.Str()
 
+class FormatParameter(Schema):
+    f = fields.Str(validate=OneOf(["json", "html", "covjson"]), metadata={"style": "form"})
+
 def create_apispec(title, version, openapi_version, settings):
     # Create an APISpec
     spec = APISpec(
@@ -0,0 +1,31 @@
+import json
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# JSON backend: "orjson" when it is installed, unless JSON_BACKEND=json
+BACKEND = "orjson" if orjson is not None and os.environ.get("JSON_BACKEND", "orjson") != "json" else "json"
+
+
+if BACKEND == "orjson":
+    def loads(data):
+        return orjson.loads(data)
+
+    def dumpb(obj):
+        return orjson.dumps(obj)
+else:
+    def loads(data):
+        if isinstance(data, bytes):
+            data = data.decode("utf-8")
+        return json.loads(data)
+
+    def dumpb(obj):
+        return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def dumps(obj):
+    """Compact JSON text of obj, the same for every backend."""
+    return dumpb(obj).decode("utf-8")
@@ -0,0 +1,45 @@
+import math
+
+CRS84 = "http://www.opengis.net/def/crs/OGC/1.3/CRS84"
+EPSG4326 = "http://www.opengis.net/def/crs/EPSG/0/4326"
+
+
+def parse_bbox(value, crs=CRS84):
+    """[minlon, minlat, maxlon, maxlat] of an OGC API bbox parameter.
+
+    Accepts 4 values or 6 with the heights, which are dropped. With crs
+    EPSG:4326 the values are in its lat/lon axis order. Raises ValueError
+    for anything that is not a bbox in lon/lat degrees.
+    """
+    try:
+        values = [float(v) for v in value.split(",")]
+    except ValueError:
+        raise ValueError("%s is not a list of numbers"%(value,))
+    if len(values) == 6:
+        values = [values[0], values[1], values[3], values[4]]
+    elif len(values) != 4:
+        raise ValueError("a bbox has 4 or 6 values, not %d"%(len(values),))
+    if any(math.isnan(v) or math.isinf(v) for v in values):
+        raise ValueError("%s is not a list of finite numbers"%(value,))
+    if crs == EPSG4326:
+        values = [values[1], values[0], values[3], values[2]]
+    minx, miny, maxx, maxy = values
+    if miny > maxy:
+        raise ValueError("the lower latitude is above the upper one")
+    if minx > maxx:
+        # Allowed by OGC API for boxes across the antimeridian, but none
+        # of the collections is
+        raise ValueError("bboxes across the antimeridian are not supported")
+    if miny < -90 or maxy > 90:
+        raise ValueError("latitudes must be between -90 and 90")
+    return values
+
+
+def intersect(a, b):
+    """Overlap of two bboxes, or None."""
+    minx, miny = max(a[0], b[0]), max(a[1], b[1])
+    maxx, maxy = min(a[2], b[2]), min(a[3], b[3])
+    if minx > maxx or miny > maxy:
+        return None
+    return [minx, miny, maxx, maxy]
+
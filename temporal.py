@@ -0,0 +1,96 @@
+from datetime import datetime, timedelta, timezone
+
+OPEN = ("", "..")
+
+# Bounds sent upstream for the open ends of an interval
+FAR_PAST = datetime(1900, 1, 1, tzinfo=timezone.utc)
+FAR_FUTURE = datetime(9999, 12, 31, 23, 59, 59, tzinfo=timezone.utc)
+
+
+def parse_datetime(value, end=False):
+    """UTC datetime of an RFC 3339 date-time or date.
+
+    A date alone is the start of that day, or its last second when end is
+    set. Raises ValueError for anything else.
+    """
+    value = value.strip()
+    if len(value) == 10:
+        day = datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+        if end:
+            return day+timedelta(days=1, seconds=-1)
+        return day
+    if value[-1:] in ("Z", "z"):
+        value = value[:-1]+"+00:00"
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        return parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def format_datetime(value):
+    return value.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def parse_interval(value):
+    """(start, end) of an OGC API datetime parameter.
+
+    Accepts an instant, start/end and half-bounded ../end or start/.. (or an
+    empty bound). Open bounds are None, an instant has start == end and a
+    date alone covers the whole day.
+    Raises ValueError for unparseable or reversed intervals.
+    """
+    if "/" not in value:
+        return parse_datetime(value), parse_datetime(value, end=True)
+    start, end = value.split("/", 1)
+    start = None if start.strip() in OPEN else parse_datetime(start)
+    end = None if end.strip() in OPEN else parse_datetime(end, end=True)
+    if start is None and end is None:
+        raise ValueError("both ends of %s are open"%(value,))
+    if start is not None and end is not None and start > end:
+        raise ValueError("%s ends before it starts"%(value,))
+    return start, end
+
+
+def time_extent(positions):
+    """(first, last) of a WMS time dimension, or None when unknown.
+
+    positions are the comma separated entries of the dimension: instants or
+    start/end/resolution ranges.
+    """
+    first = None
+    last = None
+    for position in positions or []:
+        try:
+            bounds = [parse_datetime(p) for p in position.split("/")[:2]]
+        except ValueError:
+            return None
+        if first is None or bounds[0] < first:
+            first = bounds[0]
+        if last is None or bounds[-1] > last:
+            last = bounds[-1]
+    if first is None:
+        return None
+    return first, last
+
+
+def time_parameter(interval, extent=None):
+    """WMS TIME value for interval, limited to extent (first, last) when known.
+
+    Returns None when the interval does not overlap the extent. Open bounds
+    without an extent to close them become FAR_PAST or FAR_FUTURE, so only
+    the time steps on the bounded side are selected.
+    """
+    start, end = interval
+    if extent is not None:
+        first, last = extent
+        start = first if start is None else max(start, first)
+        end = last if end is None else min(end, last)
+        if start > end:
+            return None
+    if start is None:
+        start = FAR_PAST
+    if end is None:
+        end = FAR_FUTURE
+    if start == end:
+        return format_datetime(start)
+    return "%s/%s"%(format_datetime(start), format_datetime(end))
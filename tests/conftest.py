@@ -0,0 +1,67 @@
+import os
+import sys
+
+import pytest
+
+# The modules live at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# No prebuilt artifacts and no retries of failed upstream calls, so the
+# tests see exactly what the stub answers
+os.environ.setdefault("OPENAPI_FILE", "")
+os.environ.setdefault("CAPABILITIES_SNAPSHOT", "")
+os.environ.setdefault("UPSTREAM_RETRIES", "0")
+
+COLLECTION = "stub"
+
+
+@pytest.fixture
+def app():
+    import ogcapi_f
+    return ogcapi_f
+
+
+@pytest.fixture
+def make_stub(app):
+    """Starts a bench.stubwms.StubWMS with the given arguments and serves
+    the only collection, COLLECTION, from it with empty caches."""
+    from bench.stubwms import StubWMS
+    stubs = []
+    registry = app.registry
+    config = (list(registry.collections), registry.servers, registry.path, registry.interval)
+
+    def make(**kwargs):
+        stub = StubWMS(**kwargs).start()
+        stubs.append(stub)
+        registry.interval = 0
+        registry.replace([{
+            "name": COLLECTION,
+            "title": "Stub",
+            "url": "/"+COLLECTION,
+            "service": stub.url,
+            "extent": [0.0, 48.0, 11.0, 56.0],
+        }])
+        app.capabilities_cache.invalidate()
+        for cache in (app.point_cache, app.item_store, app.compressed_cache):
+            cache.clear()
+        app.metadata.discard(COLLECTION)
+        return stub
+
+    yield make
+    for stub in stubs:
+        stub.stop()
+    collections, servers, path, interval = config
+    registry.replace(collections)
+    registry.servers = servers
+    registry.path = path
+    registry.interval = interval
+
+
+@pytest.fixture
+def stub(make_stub):
+    return make_stub()
+
+
+@pytest.fixture
+def client(app):
+    return app.app.test_client()
@@ -0,0 +1,94 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from conftest import COLLECTION
+
+ITEMS = "/collections/%s/items?f=json&npoints=2&limit=100&observedPropertyName=air_temperature__at_2m,precipitation_flux"%(COLLECTION,)
+
+
+@pytest.fixture
+def asgi(app):
+    import asgi
+    return asgi
+
+
+def get_all(asgi, paths, headers=None):
+    async def run():
+        transport = httpx.ASGITransport(app=asgi.application)
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url="http://localhost") as client:
+                return [await client.get(path, headers=headers) for path in paths]
+        finally:
+            await asgi.upstream.aclose()
+    return asyncio.run(run())
+
+
+def without_time_stamp(document):
+    return {k: v for k, v in document.items() if k != "timeStamp"}
+
+
+def test_items_like_wsgi(asgi, stub, client):
+    expected = json.loads(client.get(ITEMS).get_data())
+    response, = get_all(asgi, [ITEMS])
+    assert response.status_code == 200
+    assert response.headers["Content-Type"] == "application/geo+json"
+    assert without_time_stamp(response.json()) == without_time_stamp(expected)
+
+
+def test_item_by_id_like_wsgi(app, asgi, stub, client):
+    feature = json.loads(client.get(ITEMS).get_data())["features"][0]
+    app.item_store.clear()
+    path = "/collections/%s/items/%s"%(COLLECTION, feature["id"])
+    expected = json.loads(client.get(path).get_data())
+    app.item_store.clear()
+    response, = get_all(asgi, [path])
+    assert response.status_code == 200
+    assert response.json()["properties"] == expected["properties"]
+    assert response.json()["id"] == feature["id"]
+
+
+def test_other_routes_and_missing_items(asgi, stub):
+    collections, missing = get_all(asgi, [
+        "/collections?f=json",
+        "/collections/%s/items/1~a~1,2~3~4"%(COLLECTION,),
+    ])
+    assert collections.status_code == 200
+    assert [c["id"] for c in collections.json()["collections"]] == [COLLECTION]
+    assert missing.status_code == 404
+
+
+def test_capabilities_are_not_loaded_on_the_event_loop(app, asgi, stub, monkeypatch):
+    on_loop = []
+    load_parameters = app.load_parameters
+
+    def checked(name):
+        try:
+            asyncio.get_running_loop()
+            on_loop.append(name)
+        except RuntimeError:
+            pass
+        return load_parameters(name)
+
+    prepare_items = app.prepare_items
+
+    def prepare_and_evict(coll):
+        # The capabilities drop out of the cache before the upstream calls
+        query = prepare_items(coll)
+        app.capabilities_cache.invalidate()
+        return query
+
+    monkeypatch.setattr(app, "load_parameters", checked)
+    monkeypatch.setattr(app, "prepare_items", prepare_and_evict)
+    response, = get_all(asgi, [ITEMS+"&resultTime=2021-06-20T03:00:00Z"])
+    assert response.status_code == 200
+    assert on_loop == []
+
+
+def test_upstream_failure(app, asgi, stub):
+    app.get_parameters(COLLECTION)
+    stub.fail_first = sum(stub.calls.values())+100
+    response, = get_all(asgi, [ITEMS])
+    assert response.status_code == 502
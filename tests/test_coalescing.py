@@ -0,0 +1,47 @@
+import threading
+
+from cache import SingleFlight
+from conftest import COLLECTION
+
+ITEMS = "/collections/%s/items?f=json&observedPropertyName=air_temperature__at_2m&lonlat=5.2,52.1"%(COLLECTION,)
+
+
+def test_single_flight_shares_one_call():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def load():
+        calls.append(1)
+        release.wait(5)
+        return "value"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("k", load))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    while flight.stats()["waiters"] < 4:
+        pass
+    release.set()
+    for t in threads:
+        t.join()
+    assert results == ["value"]*5
+    assert len(calls) == 1
+
+
+def test_identical_requests_share_one_upstream_call(app, make_stub):
+    stub = make_stub(latency=0.3)
+    app.get_parameters(COLLECTION)
+    app.point_cache.max_bytes, max_bytes = 0, app.point_cache.max_bytes
+    try:
+        statuses = []
+        threads = [threading.Thread(target=lambda: statuses.append(app.app.test_client().get(ITEMS).status_code))
+                   for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        app.point_cache.max_bytes = max_bytes
+    assert statuses == [200]*4
+    assert stub.calls["getpointvalue"] == 1
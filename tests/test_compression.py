@@ -0,0 +1,58 @@
+import gzip
+import json
+
+from werkzeug.datastructures import Accept
+
+import content_encoding
+from conftest import COLLECTION
+
+ITEMS = "/collections/%s/items?f=json&npoints=4&limit=100&observedPropertyName=air_temperature__at_2m"%(COLLECTION,)
+
+
+def get(client, path, encoding="gzip", **kwargs):
+    response = client.get(path, headers={"Accept-Encoding": encoding}, **kwargs)
+    body = response.get_data()
+    if response.headers.get("Content-Encoding") == "gzip":
+        body = gzip.decompress(body)
+    return response, body
+
+
+def test_negotiate():
+    assert content_encoding.negotiate(Accept([("gzip", 1), ("identity", 0.5)]), ["zstd", "gzip"]) == "gzip"
+    assert content_encoding.negotiate(Accept([("gzip", 0), ("identity", 1)]), ["gzip"]) is None
+    assert content_encoding.negotiate(Accept([("identity", 1)]), ["gzip"]) is None
+
+
+def test_gzip_is_the_identity_body(stub, client):
+    response, body = get(client, ITEMS)
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert len(json.loads(body)["features"]) == 16
+    identity = client.get(ITEMS, headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in identity.headers
+    assert len(json.loads(identity.get_data())["features"]) == 16
+
+
+def test_small_bodies_are_sent_as_they_are(stub, client):
+    response = client.get("/conformance?f=json", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+
+
+def test_no_stale_body_after_failed_calls(app, stub, client):
+    app.get_parameters(COLLECTION)
+    # The next 8 getPointValue calls fail
+    stub.fail_first = sum(stub.calls.values())+8
+    get(client, ITEMS)
+    app.point_cache.clear()
+    response, body = get(client, ITEMS)
+    assert response.status_code == 200
+    assert len(json.loads(body)["features"]) == 16
+
+
+def test_links_of_the_requested_host(stub, client):
+    get(client, ITEMS)
+    response, body = get(client, ITEMS, base_url="http://other.example")
+    assert response.status_code == 200
+    hrefs = [link["href"] for link in json.loads(body)["links"]]
+    assert all(href.startswith("http://other.example/") for href in hrefs)
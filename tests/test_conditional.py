@@ -0,0 +1,70 @@
+import json
+
+from conftest import COLLECTION
+
+LAYER = "air_temperature__at_2m"
+# Not the latest of the stub's model runs
+PAST_RUN = "2021-06-20T03:00:00Z"
+ITEMS = "/collections/%s/items?f=json&npoints=4&limit=100&observedPropertyName=%s"%(COLLECTION, LAYER)
+
+
+def test_items_of_a_past_run(app, stub, client):
+    response = client.get(ITEMS+"&resultTime="+PAST_RUN)
+    assert response.status_code == 200
+    assert response.headers["Cache-Control"] == "public, max-age=%d"%(app.ITEMS_IMMUTABLE_MAX_AGE,)
+    assert response.headers["Last-Modified"] == "Sun, 20 Jun 2021 03:00:00 GMT"
+    etag = response.headers["ETag"]
+
+    calls = dict(stub.calls)
+    response = client.get(ITEMS+"&resultTime="+PAST_RUN, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    # Answered without going upstream
+    assert stub.calls == calls
+
+    response = client.get(ITEMS+"&resultTime="+PAST_RUN, headers={"If-None-Match": '"other"'})
+    assert response.status_code == 200
+
+
+def test_items_of_the_latest_run(app, stub, client):
+    response = client.get(ITEMS)
+    assert response.status_code == 200
+    assert response.headers["Cache-Control"] == "public, max-age=%d"%(app.ITEMS_MAX_AGE,)
+    assert "ETag" in response.headers
+
+
+def test_etag_depends_on_the_query(stub, client):
+    a = client.get(ITEMS+"&resultTime="+PAST_RUN).headers["ETag"]
+    b = client.get(ITEMS+"&resultTime="+PAST_RUN+"&nextToken=10").headers["ETag"]
+    assert a != b
+
+
+def test_no_partial_page_after_failed_calls(app, stub, client):
+    app.get_parameters(COLLECTION)
+    # The next 8 getPointValue calls fail
+    stub.fail_first = sum(stub.calls.values())+8
+    response = client.get(ITEMS+"&resultTime="+PAST_RUN)
+    assert response.status_code == 502
+    assert "ETag" not in response.headers
+    assert "max-age" not in response.headers.get("Cache-Control", "")
+
+    response = client.get(ITEMS+"&resultTime="+PAST_RUN)
+    assert response.status_code == 200
+    assert len(json.loads(response.get_data())["features"]) == 16
+
+
+def test_item_by_id(stub, client):
+    feature = json.loads(client.get(ITEMS+"&resultTime="+PAST_RUN).get_data())["features"][0]
+    response = client.get("/collections/%s/items/%s"%(COLLECTION, feature["id"]))
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    response = client.get("/collections/%s/items/%s"%(COLLECTION, feature["id"]), headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+
+def test_metadata(stub, client):
+    response = client.get("/collections/%s?f=json"%(COLLECTION,))
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    response = client.get("/collections/%s?f=json"%(COLLECTION,), headers={"If-None-Match": etag})
+    assert response.status_code == 304
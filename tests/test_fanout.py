@@ -0,0 +1,135 @@
+import contextvars
+import threading
+import time
+
+import pytest
+
+from fanout import DeadlineExceeded, FanOut
+
+
+class Tracker:
+    """fn for FanOut that records how many calls are in flight."""
+    def __init__(self, delay=0.02):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.running = 0
+        self.peak = 0
+
+    def __call__(self, item):
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        try:
+            time.sleep(self.delay)
+            return item*2
+        finally:
+            with self.lock:
+                self.running -= 1
+
+
+def test_results_in_item_order():
+    fanout = FanOut(max_workers=8, limit=4)
+    # Later items finish first
+    assert fanout.map("c", lambda i: time.sleep(0.01*(5-i)) or i, range(5)) == [0, 1, 2, 3, 4]
+
+
+def test_limit_per_key():
+    fanout = FanOut(max_workers=16, limit=3)
+    tracker = Tracker()
+    assert fanout.map("c", tracker, range(12)) == [i*2 for i in range(12)]
+    assert tracker.peak == 3
+
+
+def test_set_limit():
+    fanout = FanOut(max_workers=16, limit=8)
+    fanout.set_limit("c", 2)
+    tracker = Tracker()
+    fanout.map("c", tracker, range(8))
+    assert tracker.peak == 2
+
+
+def test_keys_share_the_pool_not_the_limit():
+    fanout = FanOut(max_workers=16, limit=2)
+    tracker = Tracker(0.05)
+    threads = [threading.Thread(target=fanout.map, args=(key, tracker, range(4))) for key in ("a", "b")]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert tracker.peak == 4
+
+
+def test_imap_yields_before_all_calls_are_done():
+    fanout = FanOut(max_workers=4, limit=4)
+    release = threading.Event()
+
+    def fn(i):
+        if i == 1:
+            release.wait(5)
+        return i
+
+    results = fanout.imap("c", fn, [0, 1])
+    assert next(results) == 0
+    release.set()
+    assert next(results) == 1
+
+
+def test_single_item_holds_the_limit():
+    # One call takes the same path as many: it waits for a slot of its key
+    fanout = FanOut(max_workers=4, limit=1)
+    release = threading.Event()
+    busy = threading.Thread(target=fanout.map, args=("c", lambda i: release.wait(5), [0]))
+    busy.start()
+    time.sleep(0.05)
+    try:
+        with pytest.raises(DeadlineExceeded):
+            fanout.map("c", lambda i: i, [0], deadline=time.monotonic()+0.1)
+    finally:
+        release.set()
+        busy.join()
+    assert fanout.map("c", lambda i: i, [7]) == [7]
+
+
+@pytest.mark.parametrize("n", [1, 3])
+def test_deadline(n):
+    fanout = FanOut(max_workers=4, limit=4)
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        fanout.map("c", lambda i: time.sleep(1), range(n), deadline=start+0.1)
+    assert time.monotonic()-start < 0.5
+
+
+def test_calls_not_started_are_cancelled():
+    fanout = FanOut(max_workers=4, limit=1)
+    started = []
+
+    def fn(i):
+        started.append(i)
+        time.sleep(0.1)
+        return i
+
+    with pytest.raises(DeadlineExceeded):
+        fanout.map("c", fn, range(5), deadline=time.monotonic()+0.05)
+    time.sleep(0.3)
+    assert len(started) < 5
+
+
+def test_exceptions_are_raised():
+    fanout = FanOut(max_workers=4, limit=4)
+
+    def fn(i):
+        if i == 2:
+            raise KeyError(i)
+        return i
+
+    with pytest.raises(KeyError):
+        fanout.map("c", fn, range(4))
+    # The slots of the failed map are free again
+    assert fanout.map("c", lambda i: i, range(4)) == [0, 1, 2, 3]
+
+
+def test_context_is_copied():
+    fanout = FanOut(max_workers=4, limit=4)
+    var = contextvars.ContextVar("var")
+    var.set("request")
+    assert fanout.map("c", lambda i: var.get(), range(3)) == ["request"]*3
@@ -0,0 +1,31 @@
+import ogcapi_f
+from bench.feature_from_dat import make_dat
+
+
+def dat(data, dims="time"):
+    return {
+        "point": {"SRS": "EPSG:4326", "coords": "5.200000,52.000000"},
+        "standard_name": "air_temperature",
+        "name": "air_temperature__at_2m",
+        "dims": dims,
+        "data": data,
+    }
+
+
+def test_one_feature_per_dimension_tuple():
+    features = ogcapi_f.feature_from_dat(make_dat(3, 2, 4), "air_temperature__at_ml", "harmonie")
+    assert len(features) == 8
+    feature = features[0]
+    assert feature["geometry"] == {"type": "Point", "coordinates": [5.2, 52.0]}
+    assert feature["properties"]["timestep"] == ["2021-06-20T00:00:00Z", "2021-06-20T01:00:00Z", "2021-06-20T02:00:00Z"]
+    assert feature["properties"]["result"] == [280.0, 280.37, 280.74]
+    assert len(set(f["id"] for f in features)) == 8
+
+
+def test_missing_values_keep_their_time_steps():
+    data = {"2021-06-20T00:00:00Z": "1.0", "2021-06-20T01:00:00Z": "", "2021-06-20T02:00:00Z": "3.0"}
+    feature = ogcapi_f.feature_from_dat(dat(data), "air_temperature__at_2m", "harmonie")[0]
+    assert feature["properties"]["timestep"] == ["2021-06-20T00:00:00Z", "2021-06-20T02:00:00Z"]
+    assert feature["properties"]["result"] == [1.0, 3.0]
+    # The id still covers the requested time steps
+    assert feature["id"].endswith("~20210620T000000Z~20210620T020000Z")
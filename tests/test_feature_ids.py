@@ -0,0 +1,68 @@
+import pytest
+
+import feature_ids
+
+
+def test_round_trip():
+    dims = [("reference_time", "2021-06-20T06:00:00Z"), ("member", "3")]
+    featureid = feature_ids.encode("air_temperature__at_2m", "5.2", "52.1", dims, "2021-06-20T06:00:00Z", "2021-06-22T05:00:00Z")
+    assert featureid == "1~air_temperature__at_2m~5.2,52.1~reference_time=20210620T060000Z~member=3~20210620T060000Z~20210622T050000Z"
+    assert feature_ids.decode(featureid) == {
+        "layer": "air_temperature__at_2m",
+        "lon": "5.2",
+        "lat": "52.1",
+        "dims": dims,
+        "first": "2021-06-20T06:00:00Z",
+        "last": "2021-06-22T05:00:00Z",
+    }
+
+
+def test_parts_make_the_id():
+    dims = [("elevation", "10")]
+    featureid = feature_ids.prefix("x", "1", "2")+feature_ids.dims_part(dims)+feature_ids.suffix("2021-06-20T06:00:00Z", "2021-06-20T07:00:00Z")
+    assert featureid == feature_ids.encode("x", "1", "2", dims, "2021-06-20T06:00:00Z", "2021-06-20T07:00:00Z")
+
+
+def test_fields_that_are_not_plain():
+    featureid = feature_ids.encode("a~b/c", "1", "2", [("level", "a=b;c")], "2021-06-20T06:00:00Z", "2021-06-20T06:00:00Z")
+    assert featureid.count("~") == 5
+    assert "/" not in featureid and ";" not in featureid
+    item = feature_ids.decode(featureid)
+    assert item["layer"] == "a~b/c"
+    assert item["dims"] == [("level", "a=b;c")]
+
+
+def test_with_point():
+    featureid = feature_ids.encode("x", "5.5", "52.5", [], "2021-06-20T06:00:00Z", "2021-06-20T07:00:00Z")
+    moved = feature_ids.with_point(featureid, "5.2", "52.1")
+    assert moved == feature_ids.encode("x", "5.2", "52.1", [], "2021-06-20T06:00:00Z", "2021-06-20T07:00:00Z")
+
+
+def test_old_format():
+    item = feature_ids.decode("harmonie;air_temperature__at_2m;5.2,52.1;reference_time=2021-06-20T06:00:00Z;2021-06-20T06:00:00Z$2021-06-22T05:00:00Z")
+    assert item["layer"] == "air_temperature__at_2m"
+    assert item["dims"] == [("reference_time", "2021-06-20T06:00:00Z")]
+    assert (item["first"], item["last"]) == ("2021-06-20T06:00:00Z", "2021-06-22T05:00:00Z")
+
+
+@pytest.mark.parametrize("featureid", [
+    "",
+    "1~x~1,2",
+    "1~x~1~20210620T060000Z~20210620T060000Z",
+    "1~x~1,2~member~20210620T060000Z~20210620T060000Z",
+    "1~x~1,2~!!!~20210620T060000Z~20210620T060000Z",
+    # first and last must be instants
+    "1~a~1,2~3~4",
+    "1~x~1,2~20210620T060000Z~later",
+    "coll;layer;1,2;2021-06-20T06:00:00Z",
+    "coll;layer;1,2;a$b",
+])
+def test_not_a_feature_id(featureid):
+    with pytest.raises(ValueError):
+        feature_ids.decode(featureid)
+
+
+def test_item_with_a_bad_id_is_not_found():
+    import ogcapi_f
+    response = ogcapi_f.app.test_client().get("/collections/harmonie/items/1~a~1,2~3~4")
+    assert response.status_code == 404
@@ -0,0 +1,37 @@
+import json
+
+from conftest import COLLECTION
+
+
+def test_etag_and_304(stub, client):
+    response = client.get("/api")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    assert client.get("/api", headers={"If-None-Match": etag}).status_code == 304
+    yaml = client.get("/api.yaml")
+    assert yaml.status_code == 200
+    assert yaml.headers["ETag"] != etag
+    assert client.get("/api.yaml", headers={"If-None-Match": yaml.headers["ETag"]}).status_code == 304
+
+
+def test_paths_of_the_collections(app, stub, client):
+    document = json.loads(client.get("/api").get_data())
+    assert "/collections/%s/items"%(COLLECTION,) in document["paths"]
+    before = client.get("/api").headers["ETag"]
+
+    # The layers become known with the capabilities
+    app.get_parameters(COLLECTION)
+    response = client.get("/api")
+    assert response.headers["ETag"] != before
+    parameters = json.loads(response.get_data())["paths"]["/collections/%s/items"%(COLLECTION,)]["get"]["parameters"]
+    names = [p for p in parameters if p["name"] == "observedPropertyName"][0]
+    assert "air_temperature__at_2m" in names["schema"]["items"]["enum"]
+
+
+def test_servers_change(app, stub, client):
+    before = client.get("/api").headers["ETag"]
+    servers = [{"url": "https://other.example/", "description": "Another server"}]
+    app.registry.servers = servers
+    response = client.get("/api")
+    assert response.headers["ETag"] != before
+    assert json.loads(response.get_data())["servers"] == servers
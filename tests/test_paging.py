@@ -0,0 +1,74 @@
+from paging import count_values, features_per_point, plan_page
+
+
+def features(counts, jobs):
+    # Results of the planned jobs, feature i of job j as (j, i)
+    return [[(j, i) for i in range(counts[j])] for j in jobs]
+
+
+def test_count_values():
+    assert count_values("*", ["1", "2", "3"]) == 3
+    assert count_values("1,2", ["1", "2", "3"]) == 2
+    assert count_values("2", ["1", "2", "3"]) == 1
+
+
+def test_features_per_point():
+    layer = {"dims": [{"name": "member", "values": ["1", "2", "3"]}, {"name": "elevation", "values": ["10", "20"]}]}
+    assert features_per_point(layer, {"member": "*", "elevation": "10"}) == 3
+    assert features_per_point(layer, {}) == 1
+    assert features_per_point(None, {}) is None
+
+
+def test_known_counts_skip_jobs_before_the_window():
+    counts = [3]*10
+    page = plan_page(counts, 7, 5)
+    assert page.jobs == [2, 3]
+    assert page.offset == 6
+    assert page.page(features(counts, page.jobs)) == [(2, 1), (2, 2), (3, 0), (3, 1), (3, 2)]
+    assert page.total == 30
+    assert page.has_more()
+
+
+def test_last_page():
+    counts = [3]*4
+    page = plan_page(counts, 10, 5)
+    assert page.jobs == [3]
+    assert page.page(features(counts, page.jobs)) == [(3, 1), (3, 2)]
+    assert not page.has_more()
+
+
+def test_unknown_counts_fetch_from_the_first_unknown_one():
+    counts = [2, None, None, None]
+    page = plan_page(counts, 3, 2)
+    assert page.jobs == [1, 2, 3]
+    assert page.offset == 2
+    assert page.total is None
+    results = [[("a", 0), ("a", 1)], [("b", 0)], [("c", 0), ("c", 1)]]
+    assert page.page(results) == [("a", 1), ("b", 0)]
+    assert page.has_more()
+
+
+def test_unknown_counts_complete():
+    page = plan_page([None, None], 0, 5)
+    assert page.page([[1], [2]]) == [1, 2]
+    assert not page.has_more()
+
+
+def test_wrong_count_drops_the_total():
+    page = plan_page([2, 2], 0, 10)
+    page.page([[1, 2], [3]])
+    assert page.total is None
+
+
+def test_no_next_window_without_features():
+    # Failed upstream calls give no features, a next link would lead to
+    # another empty page
+    page = plan_page([None]*10, 36, 5)
+    assert page.page([[] for _ in page.jobs]) == []
+    assert not page.has_more()
+
+
+def test_no_next_window_past_the_end():
+    page = plan_page([2, 2], 6, 5)
+    assert page.page(features([2, 2], page.jobs)) == []
+    assert not page.has_more()
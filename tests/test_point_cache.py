@@ -0,0 +1,26 @@
+import json
+
+from conftest import COLLECTION
+
+ITEMS = "/collections/%s/items?f=json&observedPropertyName=air_temperature__at_2m&lonlat=%s"
+
+
+def features(client, point):
+    response = client.get(ITEMS%(COLLECTION, point))
+    assert response.status_code == 200
+    return json.loads(response.get_data())["features"]
+
+
+def test_repeated_request_is_served_from_the_cache(stub, client):
+    first = features(client, "5.2,52.1")
+    calls = stub.calls.get("getpointvalue", 0)
+    assert features(client, "5.2,52.1") == first
+    assert stub.calls.get("getpointvalue", 0) == calls
+
+
+def test_nearby_points_keep_their_own_features(stub, client):
+    a = features(client, "5.20001,52.1")[0]
+    b = features(client, "5.20002,52.1")[0]
+    assert a["geometry"]["coordinates"] == [5.20001, 52.1]
+    assert b["geometry"]["coordinates"] == [5.20002, 52.1]
+    assert a["id"] != b["id"]
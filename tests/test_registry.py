@@ -0,0 +1,90 @@
+import json
+import os
+
+import pytest
+
+from conftest import COLLECTION
+from registry import CollectionRegistry, parse_config
+
+
+def write(path, document):
+    with open(path, "w") as f:
+        json.dump(document, f)
+    # A new modification time, also on file systems with a coarse one
+    mtime = os.stat(path).st_mtime+write.count
+    write.count += 1
+    os.utime(path, (mtime, mtime))
+
+write.count = 1
+
+
+def collection(name, service="http://127.0.0.1:1/wms?", **kwargs):
+    return {"name": name, "service": service, "extent": [0, 48, 11, 56], **kwargs}
+
+
+def test_parse_config():
+    collections, servers = parse_config({"servers": [{"url": "http://a/"}], "collections": [collection("a", title="A")]})
+    assert servers == [{"url": "http://a/"}]
+    assert collections[0]["title"] == "A"
+    assert collections[0]["url"] == "/a"
+    collections, servers = parse_config([collection("a")])
+    assert collections[0]["title"] == "a"
+    assert servers is None
+
+
+@pytest.mark.parametrize("document", [
+    {"collections": "a"},
+    [{"name": "a", "service": "x"}],
+    [collection("a"), collection("a")],
+    [{**collection("a"), "extent": [1, 48, 0, 56]}],
+    [{**collection("a"), "extent": [0, 48, 11]}],
+])
+def test_parse_config_rejects(document):
+    with pytest.raises(ValueError):
+        parse_config(document)
+
+
+def test_reload(tmp_path):
+    path = str(tmp_path/"collections.json")
+    write(path, [collection("a"), collection("b")])
+    registry = CollectionRegistry(path, interval=0.001)
+    changes = []
+    registry.listen(lambda *change: changes.append(change))
+    registry.load()
+    by_name = registry.by_name
+    assert [c["name"] for c in registry.collections] == ["a", "b"]
+
+    write(path, [collection("a", title="A"), collection("c")])
+    registry._checked = 0
+    registry.check()
+    assert [c["name"] for c in registry.collections] == ["a", "c"]
+    # Updated in place
+    assert registry.by_name is by_name and sorted(by_name) == ["a", "c"]
+    assert changes[-1] == (["c"], ["b"], ["a"])
+
+    # A broken file keeps the collections
+    write(path, [{"name": "d"}])
+    registry._checked = 0
+    registry.check()
+    assert [c["name"] for c in registry.collections] == ["a", "c"]
+
+
+def test_endpoints_follow_the_file(app, stub, client, tmp_path):
+    path = str(tmp_path/"collections.json")
+    write(path, {"collections": [collection(COLLECTION, stub.url)]})
+    registry = app.registry
+    registry.path = path
+    registry.load()
+    registry.interval = 0.001
+    ids = lambda: [c["id"] for c in json.loads(client.get("/collections?f=json").get_data())["collections"]]
+    assert ids() == [COLLECTION]
+
+    write(path, {"collections": [collection(COLLECTION, stub.url), collection("other", stub.url, title="Other")]})
+    registry._checked = 0
+    assert ids() == [COLLECTION, "other"]
+    assert client.get("/collections/other/items?f=json&observedPropertyName=air_temperature__at_2m").status_code == 200
+
+    write(path, {"collections": [collection("other", stub.url)]})
+    registry._checked = 0
+    assert ids() == ["other"]
+    assert client.get("/collections/%s?f=json"%(COLLECTION,)).status_code == 404
@@ -0,0 +1,54 @@
+import pytest
+
+from grid import Grid
+from spatial import EPSG4326, intersect, parse_bbox
+
+
+def test_parse_bbox():
+    assert parse_bbox("3,50,7,53") == [3.0, 50.0, 7.0, 53.0]
+    # The heights of a 6 value bbox are dropped
+    assert parse_bbox("3,50,0,7,53,100") == [3.0, 50.0, 7.0, 53.0]
+
+
+def test_parse_bbox_epsg4326_axis_order():
+    assert parse_bbox("50,3,53,7", EPSG4326) == [3.0, 50.0, 7.0, 53.0]
+
+
+@pytest.mark.parametrize("value", ["3,50,7", "3,50,7,53,1", "a,50,7,53", "3,nan,7,53", "3,50,inf,53",
+                                   "3,53,7,50", "7,50,3,53", "3,-91,7,53"])
+def test_parse_bbox_rejects(value):
+    with pytest.raises(ValueError):
+        parse_bbox(value)
+
+
+def test_intersect():
+    assert intersect([0, 0, 10, 10], [5, 5, 15, 15]) == [5, 5, 10, 10]
+    assert intersect([0, 0, 10, 10], [10, 10, 15, 15]) == [10, 10, 10, 10]
+    assert intersect([0, 0, 10, 10], [11, 0, 15, 10]) is None
+
+
+def test_snap():
+    grid = Grid(0, 50, 10, 55, 1, 1)
+    assert grid.snap(3.2, 52.7) == (3.5, 52.5)
+    # The upper and right edges belong to the last cells
+    assert grid.snap(10, 55) == (9.5, 54.5)
+    # Outside the grid the point stays where it is
+    assert grid.snap(11, 52) == (11, 52)
+
+
+def test_centers():
+    grid = Grid(0, 50, 10, 55, 1, 1)
+    assert grid.centers([2, 51, 4, 53], 100) == [[2.5, 51.5], [2.5, 52.5], [3.5, 51.5], [3.5, 52.5]]
+    # A bbox inside one cell gives that cell
+    assert grid.centers([2.2, 51.2, 2.4, 51.4], 100) == [[2.5, 51.5]]
+    # Partly outside the grid, only the cells of the grid
+    assert grid.centers([-5, 54, 1, 60], 100) == [[0.5, 54.5]]
+    assert grid.centers([11, 51, 12, 52], 100) == []
+
+
+def test_centers_max_points():
+    grid = Grid(0, 50, 10, 55, 1, 1)
+    centers = grid.centers([0, 50, 10, 55], 12)
+    assert len(centers) <= 12
+    assert centers[0] == [0.5, 50.5]
+    assert len(grid.centers([0, 50, 10, 55], 50)) == 50
@@ -0,0 +1,59 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from temporal import FAR_FUTURE, FAR_PAST, parse_datetime, parse_interval, time_extent, time_parameter
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+def test_parse_datetime():
+    assert parse_datetime("2021-06-20T06:00:00Z") == utc(2021, 6, 20, 6)
+    assert parse_datetime("2021-06-20T08:00:00+02:00") == utc(2021, 6, 20, 6)
+    assert parse_datetime("2021-06-20") == utc(2021, 6, 20)
+    assert parse_datetime("2021-06-20", end=True) == utc(2021, 6, 20, 23, 59, 59)
+
+
+def test_parse_interval():
+    assert parse_interval("2021-06-20T06:00:00Z") == (utc(2021, 6, 20, 6), utc(2021, 6, 20, 6))
+    assert parse_interval("2021-06-20") == (utc(2021, 6, 20), utc(2021, 6, 20, 23, 59, 59))
+    assert parse_interval("2021-06-20T00:00:00Z/2021-06-21T00:00:00Z") == (utc(2021, 6, 20), utc(2021, 6, 21))
+    assert parse_interval("../2021-06-21T00:00:00Z") == (None, utc(2021, 6, 21))
+    assert parse_interval("2021-06-21T00:00:00Z/..") == (utc(2021, 6, 21), None)
+    assert parse_interval("2021-06-21T00:00:00Z/") == (utc(2021, 6, 21), None)
+
+
+@pytest.mark.parametrize("value", ["../..", "/", "yesterday", "2021-06-21T00:00:00Z/2021-06-20T00:00:00Z"])
+def test_parse_interval_rejects(value):
+    with pytest.raises(ValueError):
+        parse_interval(value)
+
+
+def test_time_extent():
+    assert time_extent(["2021-06-20T00:00:00Z", "2021-06-20T01:00:00Z"]) == (utc(2021, 6, 20), utc(2021, 6, 20, 1))
+    assert time_extent(["2021-06-20T00:00:00Z/2021-06-22T00:00:00Z/PT1H"]) == (utc(2021, 6, 20), utc(2021, 6, 22))
+    assert time_extent([]) is None
+    assert time_extent(["current"]) is None
+
+
+def test_time_parameter():
+    interval = (utc(2021, 6, 20), utc(2021, 6, 21))
+    assert time_parameter(interval) == "2021-06-20T00:00:00Z/2021-06-21T00:00:00Z"
+    assert time_parameter((utc(2021, 6, 20), utc(2021, 6, 20))) == "2021-06-20T00:00:00Z"
+
+
+def test_time_parameter_within_extent():
+    extent = (utc(2021, 6, 20, 12), utc(2021, 6, 22))
+    assert time_parameter((utc(2021, 6, 20), utc(2021, 6, 21)), extent) == "2021-06-20T12:00:00Z/2021-06-21T00:00:00Z"
+    assert time_parameter((utc(2021, 6, 21), None), extent) == "2021-06-21T00:00:00Z/2021-06-22T00:00:00Z"
+    assert time_parameter((utc(2021, 6, 23), None), extent) is None
+
+
+def test_time_parameter_open_without_extent():
+    # Without an extent the open end is sent as a far bound, not as TIME=*
+    # which would also select the time steps before the start
+    start = utc(2021, 6, 21)
+    assert time_parameter((start, None)) == "2021-06-21T00:00:00Z/%s"%(FAR_FUTURE.strftime("%Y-%m-%dT%H:%M:%SZ"),)
+    assert time_parameter((None, start)) == "%s/2021-06-21T00:00:00Z"%(FAR_PAST.strftime("%Y-%m-%dT%H:%M:%SZ"),)
@@ -0,0 +1,114 @@
+import asyncio
+import os
+import threading
+from urllib.parse import parse_qsl, urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+# Connection pool and retry settings for all upstream WMS traffic
+POOL_CONNECTIONS=int(os.environ.get("UPSTREAM_POOL_CONNECTIONS", 4))
+POOL_MAXSIZE=int(os.environ.get("UPSTREAM_POOL_MAXSIZE", 32))
+RETRIES=int(os.environ.get("UPSTREAM_RETRIES", 2))
+BACKOFF_FACTOR=float(os.environ.get("UPSTREAM_BACKOFF_FACTOR", 0.2))
+RETRY_STATUS=[500, 502, 503, 504]
+
+_lock = threading.Lock()
+_session = None
+_async_client = None
+
+
+def make_session(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE,
+                 retries=RETRIES, backoff_factor=BACKOFF_FACTOR):
+    """requests.Session with keep-alive connection pools and retries.
+
+    pool_connections is the number of hosts a pool is kept for, pool_maxsize
+    the number of connections kept alive per host. Idempotent GETs are
+    retried with exponential backoff on connection errors and 5xx answers.
+    Read timeouts are not retried: the timeout is what is left of the
+    request deadline, and requests raises them as Timeout (a retried one
+    would end as a ConnectionError).
+    """
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=False,
+        status=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUS,
+        allowed_methods=["GET", "HEAD"],
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def configure(**kwargs):
+    """Replace the shared session, e.g. configure(retries=0, pool_maxsize=4)."""
+    global _session
+    with _lock:
+        old = _session
+        _session = make_session(**kwargs)
+    if old is not None:
+        old.close()
+
+
+def session():
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = make_session()
+    return _session
+
+
+def get(url, headers=None, timeout=None):
+    return session().get(url, headers=headers, timeout=timeout)
+
+
+def normalize_url(url):
+    """url with its parameter names upper cased and sorted, so requests that
+    only differ in parameter order or case get the same key."""
+    base, _, query = url.partition("?")
+    params = sorted((k.upper(), v) for k, v in parse_qsl(query, keep_blank_values=True))
+    return "%s?%s"%(base, urlencode(params))
+
+
+def async_client():
+    """Shared httpx.AsyncClient for the asgi serving mode, same pool and
+    retry settings as the blocking session."""
+    global _async_client
+    if _async_client is None:
+        if httpx is None:
+            raise RuntimeError("The async serving mode needs httpx")
+        limits = httpx.Limits(max_connections=POOL_CONNECTIONS*POOL_MAXSIZE, max_keepalive_connections=POOL_MAXSIZE)
+        transport = httpx.AsyncHTTPTransport(limits=limits, retries=RETRIES)
+        _async_client = httpx.AsyncClient(transport=transport)
+    return _async_client
+
+
+async def aget(url, headers=None, timeout=None):
+    # The transport retries connection errors, 5xx answers are retried here
+    client = async_client()
+    for attempt in range(RETRIES+1):
+        response = await client.get(url, headers=headers, timeout=timeout)
+        if response.status_code not in RETRY_STATUS or attempt == RETRIES:
+            return response
+        await asyncio.sleep(BACKOFF_FACTOR*(2**attempt))
+
+
+async def aclose():
+    global _async_client
+    if _async_client is not None:
+        client = _async_client
+        _async_client = None
+        await client.aclose()